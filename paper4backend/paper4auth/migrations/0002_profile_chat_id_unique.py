@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("paper4auth", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="profile",
+            name="chat_id",
+            field=models.CharField(unique=True),
+        ),
+    ]
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "paper4backend.settings")
+# orders/ обслуживает AsyncOrdersViewSet
+os.environ.setdefault("ASGI_MODE", "True")
 
 application = get_asgi_application()
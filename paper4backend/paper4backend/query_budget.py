@@ -0,0 +1,58 @@
+import logging
+from functools import wraps
+from typing import Callable
+
+from django.conf import settings
+from django.db import connection
+
+log = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """
+    execute_wrapper, который считает все SQL-запросы на соединении
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def query_budget(max_queries: int) -> Callable:
+    """
+    Декоратор для action во ViewSet: объявляет, сколько SQL-запросов action
+    может выполнить. Если бюджет превышен, при QUERY_BUDGET_STRICT
+    бросает QueryBudgetExceeded (тесты падают), иначе пишет warning в лог.
+
+    Пример:
+        @query_budget(3)
+        def list(self, request): ...
+    """
+
+    def decorator(view_method: Callable) -> Callable:
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                response = view_method(self, request, *args, **kwargs)
+            if counter.count > max_queries:
+                message = (
+                    f"{type(self).__name__}.{view_method.__name__} made "
+                    f"{counter.count} queries, budget is {max_queries}"
+                )
+                if settings.QUERY_BUDGET_STRICT:
+                    raise QueryBudgetExceeded(message)
+                log.warning(message)
+            return response
+
+        wrapper.query_budget = max_queries
+        return wrapper
+
+    return decorator
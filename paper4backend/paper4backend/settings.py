@@ -35,6 +35,16 @@ REGISTRATION_RECEIVING_QUEUE = os.getenv("REGISTRATION_RECEIVING_QUEUE")
 REGISTRATION_SEND_QUEUE = os.getenv("REGISTRATION_SEND_QUEUE")
 PAYMENT_RECEIVING_QUEUE = os.getenv("PAYMENT_RECEIVING_QUEUE")
 PAYMENT_SEND_QUEUE = os.getenv("PAYMENT_SEND_QUEUE")
+# Соединения открываются лениво, по одному на поток (rmq_handlers.connection)
+RMQ_HEARTBEAT = int(os.getenv("RMQ_HEARTBEAT", 60))
+RMQ_BLOCKED_TIMEOUT = float(os.getenv("RMQ_BLOCKED_TIMEOUT", 30))
+# Попытки подключения у продюсеров; консьюмеры переподключаются бесконечно
+RMQ_CONNECT_ATTEMPTS = int(os.getenv("RMQ_CONNECT_ATTEMPTS", 5))
+RMQ_RECONNECT_BACKOFF = float(os.getenv("RMQ_RECONNECT_BACKOFF", 0.5))
+RMQ_RECONNECT_MAX_BACKOFF = float(os.getenv("RMQ_RECONNECT_MAX_BACKOFF", 30))
+# Консьюмеры: потоки-обработчики и basic_qos (rmq_handlers.workers)
+RMQ_WORKERS = int(os.getenv("RMQ_WORKERS", 4))
+RMQ_PREFETCH = int(os.getenv("RMQ_PREFETCH", 16))
 # Application definition
 
 INSTALLED_APPS = [
@@ -44,6 +54,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "storages",
     "django_filters",
@@ -139,6 +150,54 @@ MEDIA_ROOT = "media/"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Превышение @query_budget во view: True — исключение (тесты), False — warning в лог
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT") == "True"
+
+# Запуск через uvicorn paper4backend.asgi:application (asgi.py выставляет True):
+# orders/ обслуживает AsyncOrdersViewSet
+ASGI_MODE = os.getenv("ASGI_MODE") == "True"
+
+# Сколько секунд хранится ответ на запрос с Idempotency-Key (shop.idempotency)
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 60 * 60 * 24))
+
+# Через сколько секунд неоплаченный CREATED заказ считается брошенным
+# (manage.py sweep_abandoned_orders)
+ABANDONED_ORDER_TTL = int(os.getenv("ABANDONED_ORDER_TTL", 60 * 60 * 24 * 7))
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Кеш каталога и его версия должны быть общими для всех процессов (uWSGI,
+# uvicorn, manage.py import_catalog), поэтому по умолчанию Redis. Кеш в памяти
+# процесса допустим только с CATALOG_CACHE_SINGLE_PROCESS=1 (runserver, тесты),
+# иначе проверка shop.E001 не даст запуститься
+CATALOG_CACHE_ALIAS = "catalog"
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", 60 * 60 * 24))
+CATALOG_CACHE_SINGLE_PROCESS = os.getenv("CATALOG_CACHE_SINGLE_PROCESS", "") == "1"
+# chat_id -> пользователь/открытый заказ (shop.resolvers): LRU в памяти процесса
+# + общий кеш, если задан CHAT_RESOLVER_CACHE_BACKEND (по умолчанию выключен)
+CHAT_RESOLVER_CACHE_ALIAS = "chat_resolver"
+CHAT_RESOLVER_CACHE_TIMEOUT = int(os.getenv("CHAT_RESOLVER_CACHE_TIMEOUT", 60 * 5))
+CHAT_RESOLVER_CACHE_SIZE = int(os.getenv("CHAT_RESOLVER_CACHE_SIZE", 10_000))
+CHAT_RESOLVER_LOCAL_TIMEOUT = float(os.getenv("CHAT_RESOLVER_LOCAL_TIMEOUT", 5))
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    CATALOG_CACHE_ALIAS: {
+        "BACKEND": os.getenv(
+            "CATALOG_CACHE_BACKEND", "django.core.cache.backends.redis.RedisCache"
+        ),
+        "LOCATION": os.getenv("CATALOG_CACHE_LOCATION", "redis://127.0.0.1:6379/1"),
+    },
+    CHAT_RESOLVER_CACHE_ALIAS: {
+        "BACKEND": os.getenv(
+            "CHAT_RESOLVER_CACHE_BACKEND", "django.core.cache.backends.dummy.DummyCache"
+        ),
+        "LOCATION": os.getenv("CHAT_RESOLVER_CACHE_LOCATION", ""),
+    },
+}
+
 # STORAGES = {
 #     "default": {
 #         "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
@@ -1,6 +1,26 @@
-from django.conf import settings
+import logging
+from functools import partial
+from typing import Callable, Optional
+
 import pika
-import json
+from pika.adapters.blocking_connection import BlockingChannel
+
+from .connection import RECONNECT_ERRORS, rmq
+
+log = logging.getLogger(__name__)
+
+
+def call_threadsafe(ch: BlockingChannel, callback: Callable) -> None:
+    """
+    Методы канала (basic_ack, basic_nack) можно вызывать только из потока его
+    соединения: воркер передаёт вызов туда через add_callback_threadsafe, и он
+    выполняется внутри start_consuming/process_data_events
+    """
+    try:
+        ch.connection.add_callback_threadsafe(callback)
+    except RECONNECT_ERRORS as error:
+        # Неподтверждённое сообщение брокер доставит заново
+        log.warning("RabbitMQ connection closed before ack (%s)", error)
 
 
 class BaseRMQ:
@@ -12,19 +32,28 @@ class BaseRMQ:
     классом, в котором определена переменная `queue` с названием очереди.
 
     Атрибуты:
-        connection (pika.BlockingConnection): Подключение к RabbitMQ. (Переменная RMQ_URL в переменных окружения)
-        channel (pika.channel.Channel): Канал для операций с очередями.
+        connection (pika.BlockingConnection): Подключение к RabbitMQ текущего
+            потока. (Переменная RMQ_URL в переменных окружения)
+        channel (pika.channel.Channel): Канал текущего потока.
+
+    Соединение открывается при первом обращении (rmq_handlers.connection),
+    импорт модуля к брокеру не ходит.
 
     Methods:
         queue_declare(): Объявляет очередь, имя которой должно быть задано
                          в дочернем классе в атрибуте `queue`.
     """
 
-    connection = pika.BlockingConnection(pika.URLParameters(settings.RMQ_URL))
-    channel = connection.channel()
+    @property
+    def connection(self) -> pika.BlockingConnection:
+        return rmq.get_connection()
+
+    @property
+    def channel(self) -> BlockingChannel:
+        return rmq.get_channel()
 
     def queue_declare(self):
-        self.channel.queue_declare(queue=self.queue)
+        rmq.queue_declare(self.queue)
 
 
 class BaseConsumer(BaseRMQ):
@@ -45,12 +74,15 @@ class BaseConsumer(BaseRMQ):
             очереди (должен быть реализован в дочернем классе).
         consuming(): Запускает бесконечное чтение очереди; останавливается
             по KeyboardInterrupt и закрывает соединение.
+        consume(on_message_callback, prefetch=None): Объявляет очередь,
+            выставляет basic_qos(prefetch), подписывается и читает её; при
+            обрыве соединения переподключается с backoff и подписывается заново.
+        on_stop(channel): Вызывается по KeyboardInterrupt до закрытия
+            соединения.
 
     Вот примерно как должно выглядить работа:
         consumer = BaseConsumer(queue=PAYMENT_RECEIVING_QUEUE)
-        consumer.queue_declare()
-        consumer.channel.basic_consume(queue=consumer.queue, on_message_callback=CALLBACK)
-        consumer.consuming()
+        consumer.consume(on_message_callback=CALLBACK)
 
     """
 
@@ -64,7 +96,37 @@ class BaseConsumer(BaseRMQ):
         try:
             self.channel.start_consuming()
         except KeyboardInterrupt:
-            self.connection.close()
+            rmq.discard()
+
+    def on_stop(self, channel: Optional[BlockingChannel]) -> None:
+        pass
+
+    def consume(
+        self, on_message_callback: Callable, prefetch: Optional[int] = None
+    ) -> None:
+        while True:
+            channel = None
+            try:
+                # Консьюмер ждёт брокер сколько угодно
+                channel = rmq.get_channel(attempts=0)
+                if prefetch:
+                    # Брокер не отдаёт больше prefetch неподтверждённых сообщений
+                    channel.basic_qos(prefetch_count=prefetch)
+                self.queue_declare()
+                channel.basic_consume(
+                    queue=self.queue, on_message_callback=on_message_callback
+                )
+                channel.start_consuming()
+                return
+            except RECONNECT_ERRORS as error:
+                log.warning(
+                    "RabbitMQ consumer lost connection (%s), reconnecting", error
+                )
+                rmq.discard()
+            except KeyboardInterrupt:
+                self.on_stop(channel)
+                rmq.discard()
+                return
 
 
 class BaseProducer(BaseRMQ):
@@ -85,23 +147,21 @@ class BaseProducer(BaseRMQ):
         basic_publish(body, exchange=""): Публикует сообщение в очередь.
         close(): Закрывает канал RabbitMQ.
         produce(...): Заготовка под сложную логику отправки (переопределяется при необходимости).
-        ack(ch, method, ...): Подтверждает доставку сообщения.
+        ack(ch, method, ...): Подтверждает доставку сообщения (из любого
+            потока, см. call_threadsafe).
     """
 
     queue = ""
 
     def basic_publish(self, body: dict, exchange: str = ""):
-        self.queue_declare()
         print(body)
-        self.channel.basic_publish(
-            routing_key=self.queue, exchange=exchange, body=json.dumps(body)
-        )
+        rmq.publish(queue=self.queue, body=body, exchange=exchange)
 
     def close(self):
-        self.channel.close()
+        rmq.discard()
 
     def produce(self, ch, method, properties, body):
         pass
 
     def ack(self, ch, method, properties=None, body=None):
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+        call_threadsafe(ch, partial(ch.basic_ack, delivery_tag=method.delivery_tag))
@@ -0,0 +1,159 @@
+import json
+import logging
+import random
+import threading
+import time
+from typing import Callable, List, Optional, TypeVar
+
+import pika
+from django.conf import settings
+from pika.adapters.blocking_connection import BlockingChannel
+from pika.exceptions import AMQPChannelError, AMQPConnectionError
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+# Ошибки, после которых соединение/канал пересоздаются
+RECONNECT_ERRORS = (AMQPConnectionError, AMQPChannelError)
+
+
+class RMQConnectionManager:
+    """
+    Ленивые соединения с RabbitMQ: ничего не открывается, пока поток не
+    попросит канал. pika.BlockingConnection не потокобезопасен, поэтому
+    у каждого потока своё соединение и канал (threading.local) — потоки
+    веб-сервера публикуют, не делясь одним каналом.
+
+    Heartbeat: BlockingConnection отвечает на heartbeat брокера только внутри
+    вызовов pika, поэтому перед выдачей простаивавшего канала вызывается
+    process_data_events(0) — он же обнаруживает разорванное соединение.
+
+    Переподключение: RMQ_CONNECT_ATTEMPTS попыток с экспоненциальной
+    задержкой RMQ_RECONNECT_BACKOFF * 2^n (не больше RMQ_RECONNECT_MAX_BACKOFF)
+    и случайным разбросом, чтобы воркеры не ломились в брокер одновременно.
+    """
+
+    def __init__(self, url: Optional[str] = None):
+        self.url = url
+        self.local = threading.local()
+        # Все открытые соединения для close_all() при остановке процесса
+        self.connections: List[pika.BlockingConnection] = []
+        self.lock = threading.Lock()
+
+    def get_parameters(self) -> pika.URLParameters:
+        parameters = pika.URLParameters(self.url or settings.RMQ_URL)
+        parameters.heartbeat = settings.RMQ_HEARTBEAT
+        parameters.blocked_connection_timeout = settings.RMQ_BLOCKED_TIMEOUT
+        return parameters
+
+    def get_backoff(self, attempt: int) -> float:
+        delay = min(
+            settings.RMQ_RECONNECT_BACKOFF * 2**attempt,
+            settings.RMQ_RECONNECT_MAX_BACKOFF,
+        )
+        return delay * random.uniform(0.5, 1)
+
+    def connect(self, attempts: Optional[int] = None) -> pika.BlockingConnection:
+        """
+        attempts=0 — пытаться бесконечно (консьюмеры)
+        """
+        if attempts is None:
+            attempts = settings.RMQ_CONNECT_ATTEMPTS
+        attempt = 0
+        while True:
+            try:
+                connection = pika.BlockingConnection(self.get_parameters())
+            except AMQPConnectionError as error:
+                attempt += 1
+                if attempts and attempt >= attempts:
+                    raise
+                delay = self.get_backoff(attempt - 1)
+                log.warning(
+                    "RabbitMQ connection failed (%s), retry %d in %.1fs",
+                    error,
+                    attempt,
+                    delay,
+                )
+                time.sleep(delay)
+                continue
+            with self.lock:
+                self.connections.append(connection)
+            return connection
+
+    def get_connection(self, attempts: Optional[int] = None) -> pika.BlockingConnection:
+        connection = getattr(self.local, "connection", None)
+        if connection is not None and connection.is_open:
+            try:
+                connection.process_data_events(time_limit=0)
+                return connection
+            except RECONNECT_ERRORS as error:
+                log.warning("RabbitMQ connection lost (%s), reconnecting", error)
+        self.discard()
+        self.local.connection = self.connect(attempts=attempts)
+        return self.local.connection
+
+    def get_channel(self, attempts: Optional[int] = None) -> BlockingChannel:
+        connection = self.get_connection(attempts=attempts)
+        channel = getattr(self.local, "channel", None)
+        if channel is None or not channel.is_open:
+            channel = self.local.channel = connection.channel()
+            # Очереди, уже объявленные на этом канале
+            self.local.declared = set()
+        return channel
+
+    def queue_declare(self, queue: str) -> None:
+        channel = self.get_channel()
+        if queue not in self.local.declared:
+            channel.queue_declare(queue=queue)
+            self.local.declared.add(queue)
+
+    def run(self, operation: Callable[[BlockingChannel], T]) -> T:
+        """
+        operation(channel) с одним повтором на новом соединении,
+        если старое оборвалось
+        """
+        try:
+            return operation(self.get_channel())
+        except RECONNECT_ERRORS as error:
+            log.warning("RabbitMQ operation failed (%s), reconnecting", error)
+            self.discard()
+            return operation(self.get_channel())
+
+    def publish(self, queue: str, body: dict, exchange: str = "") -> None:
+        def operation(channel: BlockingChannel) -> None:
+            self.queue_declare(queue)
+            channel.basic_publish(
+                exchange=exchange, routing_key=queue, body=json.dumps(body)
+            )
+
+        self.run(operation)
+
+    def discard(self) -> None:
+        """
+        Закрывает соединение текущего потока (если оно ещё живо) и забывает его
+        """
+        connection = getattr(self.local, "connection", None)
+        self.local.connection = self.local.channel = None
+        if connection is None:
+            return
+        with self.lock:
+            if connection in self.connections:
+                self.connections.remove(connection)
+        if connection.is_open:
+            try:
+                connection.close()
+            except RECONNECT_ERRORS:
+                pass
+
+    def close_all(self) -> None:
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            if connection.is_open:
+                try:
+                    connection.close()
+                except RECONNECT_ERRORS:
+                    pass
+
+
+rmq = RMQConnectionManager()
@@ -1,30 +1,28 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
-import json
-from rmq_handlers.base_rmq import BaseConsumer, BaseProducer
-from rmq_handlers.urls import urlpatterns
+from rmq_handlers.workers import ConsumerRuntime
 
 
 class Command(BaseCommand):
     help = "Command for consuming payment API"
 
-    def callback(
-        self,
-        ch: "BlockingChannel",
-        method: "Basic.Deliver",
-        properties: "BasicProperties",
-        body: bytes,
-    ) -> None:
-        dict_body: dict = json.loads(body)
-        queue_name = dict_body.get("type")
-        producer: BaseProducer = urlpatterns.get(queue_name)
-        if not producer is None:
-            producer().produce(ch=ch, method=method, properties=properties, body=body)
-
-    def handle(self, *args, **options):
-        consumer = BaseConsumer(queue=settings.PAYMENT_RECEIVING_QUEUE)
-        consumer.queue_declare()
-        consumer.channel.basic_consume(
-            queue=consumer.queue, on_message_callback=self.callback
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.RMQ_WORKERS,
+            help="Потоков-обработчиков",
+        )
+        parser.add_argument(
+            "--prefetch",
+            type=int,
+            default=settings.RMQ_PREFETCH,
+            help="Неподтверждённых сообщений в работе (basic_qos)",
         )
-        consumer.consuming()
+
+    def handle(self, *args, **options) -> None:
+        ConsumerRuntime(
+            queue=settings.PAYMENT_RECEIVING_QUEUE,
+            workers=options["workers"],
+            prefetch=max(options["prefetch"], options["workers"]),
+        ).run()
@@ -1,14 +1,16 @@
 from getopt import error
 
 from django.db.models import QuerySet
-from django.db import transaction
+from typing import Optional
 import json
 
 from pydantic import ValidationError, BaseModel
 
 from paper4auth.models import User, Profile
-from shop.models import Orders, Payment
-from shop.choices import OrderStatusChoices, PaidStatusChoices
+from shop.models import Orders
+from shop.choices import OrderStatusChoices
+from shop.payments import PaymentTransition, apply_payment_status
+from shop.resolvers import chat_resolver
 from rmq_handlers.validators import (
     PaymentInitRequest,
     PaymentInitResponse,
@@ -159,9 +161,11 @@ class PaymentUtils(BaseUtils):
         chat_id: str = data.chat_id
         correlation_id: str = data.correlation_id
         try:
-            order: QuerySet[Orders] = PaymentUtils.get_order_queryset(
-                chat_id=chat_id
-            ).first()
+            order: Orders = (
+                PaymentUtils.get_order_queryset(chat_id=chat_id)
+                .select_related("payment")
+                .first()
+            )
             currency = order.payment.currency
             amount = order.payment.amount
             name = order.payment.name
@@ -190,15 +194,30 @@ class PaymentUtils(BaseUtils):
         )
 
     @staticmethod
-    @transaction.atomic
-    def set_paid_status(status: str, chat_id: str) -> None:
-        order: QuerySet[Orders] = PaymentUtils.get_order_queryset(chat_id=chat_id)
-        payment: Payment = order.first().payment
-        if status == PaidStatusChoices.PAID:
-            payment.status = PaidStatusChoices.PAID
-            payment.save()
-            order.first().status = OrderStatusChoices.PAID
-            order.first().save()
+    def set_paid_status(status: str, chat_id: str) -> Optional[PaymentTransition]:
+        """
+        None — у chat_id нет CREATED заказа. Если закешированный заказ уже не
+        CREATED (оплачен в другом процессе), один раз перечитывает открытый
+        заказ из БД
+        """
+        order_id = getattr(chat_resolver.resolve_order(chat_id), "order_id", None)
+        if order_id is None:
+            return None
+        transition = apply_payment_status(order_ids=[order_id], status=status).get(
+            order_id
+        )
+        stale = (
+            transition is not None
+            and not transition.applied
+            and transition.order_status != OrderStatusChoices.CREATED
+        )
+        if stale:
+            fresh_id = getattr(chat_resolver.refresh(chat_id), "order_id", None)
+            if fresh_id not in (None, order_id):
+                return apply_payment_status(order_ids=[fresh_id], status=status).get(
+                    fresh_id
+                )
+        return transition
 
     @staticmethod
     def status_payment(
@@ -215,21 +234,21 @@ class PaymentUtils(BaseUtils):
         chat_id: str = data.chat_id
         correlation_id: str = data.correlation_id
         status = data.data.status
-        try:
-            PaymentUtils.set_paid_status(chat_id=chat_id, status=status)
-            return PaymentStatusResponse(
+        transition = PaymentUtils.set_paid_status(chat_id=chat_id, status=status)
+        if transition is None:
+            return PaymentStatusErrorResponse(
                 chat_id=chat_id,
                 correlation_id=PaymentUtils.increment_correlation_id(
                     correlation_id=correlation_id
                 ),
+                data={"error": f"Order is not found by {chat_id}."},
             )
-        except AttributeError:
-            return PaymentStatusErrorResponse(
+        if transition.applied:
+            return PaymentStatusResponse(
                 chat_id=chat_id,
                 correlation_id=PaymentUtils.increment_correlation_id(
                     correlation_id=correlation_id
                 ),
-                data={"error": f"Order is not found by {chat_id}."},
             )
 
         return PaymentStatusErrorResponse(
@@ -237,5 +256,8 @@ class PaymentUtils(BaseUtils):
             correlation_id=PaymentUtils.increment_correlation_id(
                 correlation_id=correlation_id
             ),
-            data={"error": f"Status is invalid"},
+            data={
+                "error": f"Status is invalid: payment is "
+                f"{transition.payment_status}, can't set {status}"
+            },
         )
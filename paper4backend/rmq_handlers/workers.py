@@ -0,0 +1,100 @@
+import json
+import logging
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+
+from django.db import close_old_connections
+from pika.adapters.blocking_connection import BlockingChannel
+
+from .base_rmq import BaseConsumer, call_threadsafe
+from .connection import RECONNECT_ERRORS, rmq
+from .urls import urlpatterns
+
+log = logging.getLogger(__name__)
+
+
+def interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+class ConsumerRuntime(BaseConsumer):
+    """
+    Консьюмер с пулом потоков: поток соединения только принимает сообщения
+    и отдаёт их в ThreadPoolExecutor, обработчики из rmq_handlers.urls
+    работают в воркерах. Поток соединения не блокируется обработкой, поэтому
+    heartbeat обслуживается вовремя.
+
+    basic_qos(prefetch) ограничивает число сообщений в работе: очередь пула
+    не растёт дальше prefetch, остальное ждёт в брокере. prefetch не меньше
+    workers, иначе часть воркеров простаивает.
+
+    ack/nack из воркера передаются в поток соединения через
+    add_callback_threadsafe (BaseProducer.ack). Ответы воркер публикует через
+    своё соединение (rmq, по одному на поток).
+
+    У каждого воркера своё соединение с БД (Django хранит их по потокам);
+    close_old_connections до и после сообщения закрывает оборванные
+    и устаревшие по CONN_MAX_AGE, как это делает Django на каждый запрос.
+
+    Сообщение без обработчика или с ошибкой обработки отклоняется без
+    возврата в очередь, чтобы не крутиться в ней бесконечно.
+    """
+
+    def __init__(self, queue: str, workers: int, prefetch: int):
+        super().__init__(queue)
+        self.workers = workers
+        self.prefetch = prefetch
+        self.pool: Optional[ThreadPoolExecutor] = None
+
+    def reject(self, ch, method) -> None:
+        call_threadsafe(
+            ch, partial(ch.basic_nack, delivery_tag=method.delivery_tag, requeue=False)
+        )
+
+    def on_message(self, ch, method, properties, body: bytes) -> None:
+        self.pool.submit(self.handle, ch, method, properties, body)
+
+    def handle(self, ch, method, properties, body: bytes) -> None:
+        close_old_connections()
+        try:
+            message_type = json.loads(body).get("type")
+            producer = urlpatterns.get(message_type)
+            if producer is None:
+                log.warning("No handler for message type %r, rejected", message_type)
+                self.reject(ch, method)
+                return
+            producer().produce(ch=ch, method=method, properties=properties, body=body)
+        except Exception:
+            log.exception("Message %s failed, rejected", method.delivery_tag)
+            self.reject(ch, method)
+        finally:
+            close_old_connections()
+
+    def on_stop(self, channel: Optional[BlockingChannel]) -> None:
+        """
+        Отписывается, дожидается воркеров и отправляет их ack до закрытия
+        соединения; неподтверждённое брокер доставит заново
+        """
+        try:
+            if channel is not None and channel.is_open:
+                channel.stop_consuming()
+            self.pool.shutdown(wait=True)
+            if channel is not None and channel.is_open:
+                channel.connection.process_data_events(time_limit=0)
+        except RECONNECT_ERRORS as error:
+            log.warning("RabbitMQ connection lost on shutdown (%s)", error)
+
+    def run(self) -> None:
+        # docker stop / systemd шлют SIGTERM: останавливаемся как по Ctrl+C
+        signal.signal(signal.SIGTERM, interrupt)
+        self.pool = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix=f"rmq-{self.queue}"
+        )
+        try:
+            self.consume(on_message_callback=self.on_message, prefetch=self.prefetch)
+        finally:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            # Соединения воркеров для публикации ответов
+            rmq.close_all()
@@ -0,0 +1,196 @@
+import gzip
+import re
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from typing import Iterator, List
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+from .choices import OrderStatusChoices
+from .models import Orders, Payment, ProductToOrder
+
+# Таблицы из миграции 0024, секционированы по месяцу created_timestamp заказа
+ORDERS_ARCHIVE_TABLE = "shop_orders_archive"
+LINES_ARCHIVE_TABLE = "shop_producttoorder_archive"
+ARCHIVE_TABLES = (ORDERS_ARCHIVE_TABLE, LINES_ARCHIVE_TABLE)
+ORDERS_ARCHIVE_PATH = "archive/orders"
+# Статусы, после которых заказ больше не меняется
+ARCHIVABLE_ORDER_STATUSES = [
+    OrderStatusChoices.SUCCESS,
+    OrderStatusChoices.CANCELLED,
+    OrderStatusChoices.FAILED,
+    OrderStatusChoices.RETURNED,
+]
+PARTITION_RE = re.compile(r"_p(\d{4})_(\d{2})$")
+
+ARCHIVE_ORDERS_SQL = f"""
+INSERT INTO {ORDERS_ARCHIVE_TABLE} (
+    uuid, user_id, status, sender_service, created_timestamp, total,
+    payment_uuid, payment_status, payment_currency, payment_timestamp
+)
+SELECT o.uuid, o.user_id, o.status, o.sender_service, o.created_timestamp,
+       o.total, p.uuid, p.status, p.currency, p.timestamp
+FROM {Orders._meta.db_table} o
+LEFT JOIN {Payment._meta.db_table} p ON p.order_id = o.uuid
+WHERE o.uuid = ANY(%s::uuid[])
+"""
+ARCHIVE_LINES_SQL = f"""
+INSERT INTO {LINES_ARCHIVE_TABLE} (order_id, product_id, count, created_timestamp)
+SELECT l.order_id, l.product_id, l.count, o.created_timestamp
+FROM {ProductToOrder._meta.db_table} l
+JOIN {Orders._meta.db_table} o ON o.uuid = l.order_id
+WHERE l.order_id = ANY(%s::uuid[])
+"""
+
+
+def month_start(value: datetime, shift: int = 0) -> datetime:
+    """
+    Начало месяца value (UTC), сдвинутое на shift месяцев
+    """
+    value = value.astimezone(dt_timezone.utc)
+    index = value.year * 12 + value.month - 1 + shift
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def partition_month(name: str) -> datetime:
+    year, month = PARTITION_RE.search(name).groups()
+    return datetime(int(year), int(month), 1, tzinfo=dt_timezone.utc)
+
+
+def create_partitions(start: datetime, end: datetime) -> List[str]:
+    """
+    Секции обеих архивных таблиц для месяцев с start по end включительно,
+    возвращает имена созданных
+    """
+    created = []
+    month = month_start(start)
+    with connection.cursor() as cursor:
+        while month <= end:
+            upper = month_start(month, 1)
+            for table in ARCHIVE_TABLES:
+                name = partition_name(table, month)
+                cursor.execute("SELECT to_regclass(%s)", [name])
+                if cursor.fetchone()[0] is None:
+                    cursor.execute(
+                        f"CREATE TABLE {name} PARTITION OF {table} "
+                        "FOR VALUES FROM (%s) TO (%s)",
+                        [month, upper],
+                    )
+                    created.append(name)
+            month = upper
+    return created
+
+
+def get_partitions(table: str) -> List[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass ORDER BY c.relname",
+            [table],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def get_detached_partitions() -> List[str]:
+    """
+    Отсоединённые секции, ещё не выгруженные в storage
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname FROM pg_class WHERE relkind = 'r' "
+            "AND NOT relispartition AND relname ~ %s ORDER BY relname",
+            [f"^({'|'.join(ARCHIVE_TABLES)})_p[0-9]{{4}}_[0-9]{{2}}$"],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class OrdersArchiver:
+    """
+    Переносит завершённые заказы (ARCHIVABLE_ORDER_STATUSES) старше before
+    из Orders/ProductToOrder/Payment в помесячные секции архивных таблиц.
+    Рабочие таблицы остаются маленькими, ORM и админка их не замечают;
+    старые секции архива отсоединяются (DETACH) и выгружаются в storage
+    как csv.gz, после чего удаляются.
+
+    Перенос идёт пачками по chunk_size, каждая в своей транзакции
+    с SELECT ... FOR UPDATE SKIP LOCKED, как в shop.sweeper.
+    """
+
+    def __init__(self, before: datetime, chunk_size: int = 1000):
+        self.before = before
+        self.chunk_size = chunk_size
+
+    def archive_chunk(self) -> int:
+        """
+        Переносит одну пачку, возвращает число заказов
+        """
+        with transaction.atomic():
+            rows = list(
+                Orders.objects.filter(
+                    status__in=ARCHIVABLE_ORDER_STATUSES,
+                    created_timestamp__lt=self.before,
+                )
+                .order_by("created_timestamp")
+                .select_for_update(skip_locked=True)
+                .values_list("uuid", "created_timestamp")[: self.chunk_size]
+            )
+            if not rows:
+                return 0
+            create_partitions(rows[0][1], rows[-1][1])
+            order_ids = [str(uuid) for uuid, _ in rows]
+            with connection.cursor() as cursor:
+                cursor.execute(ARCHIVE_ORDERS_SQL, [order_ids])
+                cursor.execute(ARCHIVE_LINES_SQL, [order_ids])
+            # Payment и ProductToOrder удаляются каскадом
+            Orders.objects.filter(uuid__in=order_ids).delete()
+        return len(rows)
+
+    def archive(self) -> Iterator[int]:
+        """
+        Генератор: после каждой пачки отдаёт число перенесённых заказов
+        """
+        while archived := self.archive_chunk():
+            yield archived
+
+    @staticmethod
+    def detach(before: datetime) -> List[str]:
+        """
+        Отсоединяет секции месяцев раньше before: они остаются отдельными
+        таблицами (pg_dump, export) и больше не участвуют в запросах к архиву
+        """
+        detached = []
+        with connection.cursor() as cursor:
+            for table in ARCHIVE_TABLES:
+                for name in get_partitions(table):
+                    if partition_month(name) < month_start(before):
+                        cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+                        detached.append(name)
+        return detached
+
+    @staticmethod
+    def export(name: str) -> str:
+        """
+        Выгружает отсоединённую секцию в storage как csv.gz через временный
+        файл (память не растёт с размером секции) и удаляет таблицу.
+        Возвращает путь в storage.
+        """
+        with tempfile.TemporaryFile() as file:
+            with gzip.GzipFile(fileobj=file, mode="wb") as archive:
+                with connection.cursor() as cursor:
+                    cursor.copy_expert(
+                        f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", archive
+                    )
+            file.seek(0)
+            path = default_storage.save(
+                f"{ORDERS_ARCHIVE_PATH}/{name}.csv.gz", File(file)
+            )
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {name}")
+        return path
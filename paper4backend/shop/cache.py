@@ -0,0 +1,108 @@
+import hashlib
+import time
+from typing import Any, Dict, FrozenSet, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from django.db import transaction
+from rest_framework.request import Request
+
+from .models import Products
+
+CATALOG_VERSION_KEY = "catalog:version"
+
+
+def get_catalog_cache() -> BaseCache:
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def get_catalog_version() -> int:
+    """
+    Текущая версия каталога. Если ключ потерян (рестарт, вытеснение),
+    версия стартует с time_ns, чтобы не совпасть со старыми записями.
+    """
+    cache = get_catalog_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version() -> None:
+    cache = get_catalog_cache()
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def bump_catalog_version_on_commit() -> None:
+    """
+    Версию меняем только после коммита: иначе параллельный запрос успеет
+    закешировать старые данные уже под новой версией.
+    """
+    transaction.on_commit(bump_catalog_version)
+
+
+class CatalogResponseCache:
+    """
+    Кеш ответа списка товаров, ключ = версия каталога + хост + query params
+    (фильтры, сортировка, курсор, page_size). ETag строится из того же ключа,
+    поэтому If-None-Match проверяется без обращения к БД и к телу в кеше.
+    """
+
+    prefix = "catalog:list"
+
+    def __init__(self, request: Request):
+        self.cache = get_catalog_cache()
+        params = sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            for value in values
+        )
+        raw = f"{get_catalog_version()}|{request.get_host()}|{request.path}|{params}"
+        self.digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @property
+    def key(self) -> str:
+        return f"{self.prefix}:{self.digest}"
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.digest[:32]}"'
+
+    def get(self) -> Optional[Any]:
+        return self.cache.get(self.key)
+
+    def set(self, data: Any) -> None:
+        self.cache.set(self.key, data, timeout=settings.CATALOG_CACHE_TIMEOUT)
+
+
+def get_tag_product_ids(slugs: Iterable[str]) -> Dict[str, FrozenSet]:
+    """
+    Предпосчитанные множества tag slug -> uuid товаров для текущей версии
+    каталога. Недостающие теги добираются одним запросом к таблице связей.
+    """
+    cache = get_catalog_cache()
+    version = get_catalog_version()
+    keys = {slug: f"catalog:tag:{version}:{slug}" for slug in set(slugs)}
+    cached = cache.get_many(keys.values())
+    result = {slug: cached[key] for slug, key in keys.items() if key in cached}
+
+    missing = [slug for slug in keys if slug not in result]
+    if missing:
+        fetched = {slug: set() for slug in missing}
+        rows = Products.tags.through.objects.filter(tags__slag__in=missing).values_list(
+            "tags__slag", "products_id"
+        )
+        for slug, product_id in rows:
+            fetched[slug].add(product_id)
+        fetched = {slug: frozenset(ids) for slug, ids in fetched.items()}
+        cache.set_many(
+            {keys[slug]: ids for slug, ids in fetched.items()},
+            timeout=settings.CATALOG_CACHE_TIMEOUT,
+        )
+        result.update(fetched)
+    return result
@@ -0,0 +1,207 @@
+import csv
+import hashlib
+import json
+from decimal import Decimal
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from django.db import transaction
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+from .cache import bump_catalog_version_on_commit
+from .choices import OrderStatusChoices
+from .models import Orders, Products, ProductImage, Tags, tag_slug
+from .snapshots import mark_snapshot_dirty
+
+# Разделитель списков (tags, images) в CSV
+CSV_LIST_SEPARATOR = "|"
+SLUG_MAX_LENGTH = Tags._meta.get_field("slag").max_length
+
+
+class CatalogFeedRow(BaseModel):
+    """
+    Строка фида каталога. uuid — ключ upsert'а товара, tags — имена тегов,
+    images — пути уже загруженных в storage файлов.
+    """
+
+    uuid: UUID
+    name: str = Field(min_length=1)
+    description: Optional[str] = None
+    price: Decimal = Field(ge=0, max_digits=15, decimal_places=2)
+    sale: int = Field(default=0, ge=0, le=100)
+    is_archive: bool = False
+    tags: List[str] = []
+    images: List[str] = []
+
+    @field_validator("tags", "images", mode="before")
+    @classmethod
+    def split_csv_list(cls, value):
+        if isinstance(value, str):
+            return [item.strip() for item in value.split(CSV_LIST_SEPARATOR)]
+        return value
+
+    @field_validator("tags", "images")
+    @classmethod
+    def drop_empty(cls, value: List[str]) -> List[str]:
+        return [item for item in value if item]
+
+
+def read_feed(path: str, feed_format: str) -> Iterator[dict]:
+    """
+    Построчно читает CSV/JSONL, весь файл в память не грузится
+    """
+    with open(path, newline="", encoding="utf-8") as file:
+        if feed_format == "csv":
+            for row in csv.DictReader(file):
+                yield {key: value for key, value in row.items() if value != ""}
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def chunked(rows: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(rows)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class CatalogImporter:
+    """
+    Upsert товаров, тегов, M2M и картинок пачками: на каждый chunk фиксированное
+    число запросов и отдельная транзакция, поэтому упавший импорт можно
+    продолжить с --skip <сколько строк уже закоммичено>.
+
+    Связи и картинки товара из фида заменяются целиком.
+    bulk_create не шлёт сигналы: версия каталога поднимается один раз на chunk,
+    товары и их прежние теги помечаются для snapshot'а тоже здесь,
+    а варианты картинок добирает команда generate_image_variants.
+    """
+
+    product_update_fields = [
+        "name",
+        "description",
+        "price",
+        "sale",
+        "is_archive",
+        "updated_at",
+    ]
+
+    def __init__(self):
+        self.tag_ids: Dict[str, UUID] = {}
+
+    def parse(self, raw_rows: List[dict]) -> Tuple[List[CatalogFeedRow], List[str]]:
+        rows, errors = {}, []
+        for raw in raw_rows:
+            try:
+                row = CatalogFeedRow(**raw)
+            except (ValidationError, TypeError) as error:
+                errors.append(f"{raw.get('uuid')}: {error}")
+                continue
+            # ON CONFLICT не может обновить одну строку дважды: последняя побеждает
+            rows[row.uuid] = row
+        return list(rows.values()), errors
+
+    def upsert_tags(self, rows: List[CatalogFeedRow]) -> None:
+        """
+        Вставляет только новые теги: slug существующих могли поправить
+        вручную, на нём держатся URL фильтров. Если slug уже занят (в БД или
+        другим тегом этого chunk'а), к нему добавляется хеш имени
+        """
+        names = {name for row in rows for name in row.tags} - self.tag_ids.keys()
+        if not names:
+            return
+        self.tag_ids.update(
+            Tags.objects.filter(name__in=names).values_list("name", "uuid")
+        )
+        new_names = sorted(names - self.tag_ids.keys())
+        if not new_names:
+            return
+        slugs = {name: tag_slug(name) for name in new_names}
+        taken = set(
+            Tags.objects.filter(slag__in=slugs.values()).values_list("slag", flat=True)
+        )
+        tags = []
+        for name in new_names:
+            slug = slugs[name]
+            if slug in taken:
+                digest = hashlib.sha1(name.encode()).hexdigest()[:8]
+                slug = f"{slug[:SLUG_MAX_LENGTH - len(digest) - 1]}-{digest}"
+            taken.add(slug)
+            tags.append(Tags(name=name, slag=slug))
+        # Тег с тем же именем мог вставить параллельный импорт
+        Tags.objects.bulk_create(tags, ignore_conflicts=True)
+        self.tag_ids.update(
+            Tags.objects.filter(name__in=new_names).values_list("name", "uuid")
+        )
+
+    def upsert_products(self, rows: List[CatalogFeedRow]) -> None:
+        Products.objects.bulk_create(
+            [
+                Products(
+                    uuid=row.uuid,
+                    name=row.name,
+                    description=row.description,
+                    price=row.price,
+                    sale=row.sale,
+                    is_archive=row.is_archive,
+                )
+                for row in rows
+            ],
+            update_conflicts=True,
+            unique_fields=["uuid"],
+            update_fields=self.product_update_fields,
+        )
+
+    def set_tags(self, rows: List[CatalogFeedRow]) -> None:
+        through = Products.tags.through
+        links = through.objects.filter(products_id__in=[row.uuid for row in rows])
+        mark_snapshot_dirty(
+            product_ids=[row.uuid for row in rows],
+            tag_ids=set(links.values_list("tags_id", flat=True)),
+        )
+        links.delete()
+        through.objects.bulk_create(
+            [
+                through(products_id=row.uuid, tags_id=self.tag_ids[name])
+                for row in rows
+                for name in set(row.tags)
+            ],
+            ignore_conflicts=True,
+        )
+
+    def set_images(self, rows: List[CatalogFeedRow]) -> None:
+        wanted = {(row.uuid, file) for row in rows for file in row.images}
+        existing = {}
+        for pk, product_id, file in ProductImage.objects.filter(
+            product_id__in=[row.uuid for row in rows]
+        ).values_list("uuid", "product_id", "file"):
+            existing[(product_id, file)] = pk
+        stale = [pk for key, pk in existing.items() if key not in wanted]
+        if stale:
+            ProductImage.objects.filter(uuid__in=stale).delete()
+        ProductImage.objects.bulk_create(
+            [
+                ProductImage(product_id=product_id, file=file)
+                for product_id, file in wanted
+                if (product_id, file) not in existing
+            ]
+        )
+
+    def import_chunk(self, raw_rows: List[dict]) -> Tuple[int, List[str]]:
+        rows, errors = self.parse(raw_rows)
+        if rows:
+            with transaction.atomic():
+                self.upsert_tags(rows)
+                self.upsert_products(rows)
+                self.set_tags(rows)
+                self.set_images(rows)
+                # bulk upsert мог поменять цены -> суммы открытых заказов
+                # с этими товарами; оплаченные хранят сумму оплаты
+                Orders.objects.filter(
+                    status=OrderStatusChoices.CREATED,
+                    products__product_id__in=[row.uuid for row in rows],
+                ).recompute_totals()
+                bump_catalog_version_on_commit()
+        return len(rows), errors
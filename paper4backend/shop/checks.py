@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+# Бэкенды, у которых у каждого процесса свои данные
+PROCESS_LOCAL_CACHES = {"django.core.cache.backends.locmem.LocMemCache"}
+
+
+@register()
+def check_catalog_cache(app_configs, **kwargs):
+    """
+    Версия каталога (shop.cache) меняется из любого процесса: другой воркер,
+    import_catalog, generate_image_variants. С кешем в памяти процесса
+    остальные процессы её не увидят и до CATALOG_CACHE_TIMEOUT отдают старые
+    страницы и 304.
+    """
+    backend = settings.CACHES[settings.CATALOG_CACHE_ALIAS]["BACKEND"]
+    if backend in PROCESS_LOCAL_CACHES and not settings.CATALOG_CACHE_SINGLE_PROCESS:
+        return [
+            Error(
+                f"Catalog cache {backend!r} is local to the process.",
+                hint="Use a shared backend (CATALOG_CACHE_BACKEND=django.core."
+                "cache.backends.redis.RedisCache) or set "
+                "CATALOG_CACHE_SINGLE_PROCESS=1 for a single process.",
+                id="shop.E001",
+            )
+        ]
+    return []
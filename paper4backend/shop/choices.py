@@ -22,3 +22,8 @@ class CurrencyChoices(models.TextChoices):
     USD = "USD", "Доллар"
     RUB = "RUB", "Рубль"
     UAH = "UAH", "Гривна"
+
+
+class TagsMatchChoices(models.TextChoices):
+    ANY = "any", "Any tag"
+    ALL = "all", "All tags"
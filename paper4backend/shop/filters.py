@@ -1,9 +1,112 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField, QuerySet
+from django.db.models.functions import Cast
 from django_filters import rest_framework as filters
-from .models import Products
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.request import Request
+from .cache import get_tag_product_ids
+from .choices import OrderStatusChoices, TagsMatchChoices
+from .models import Orders, Products, Tags, PRODUCT_SEARCH_CONFIG
+
+
+class SlugInFilter(filters.BaseInFilter, filters.CharFilter):
+    pass
 
 
 class ProductTagsFilter(filters.FilterSet):
-    tags = filters.CharFilter(field_name="tags__name", lookup_expr="icontains")
+    tags = SlugInFilter(
+        method="filter_tags",
+        help_text="Tag slugs separated by commas (exact match).",
+    )
+    tags_match = filters.ChoiceFilter(
+        choices=TagsMatchChoices.choices,
+        method="filter_tags_match",
+        help_text="any — product has at least one of the tags, all — every tag.",
+    )
+    tag_search = filters.CharFilter(
+        method="filter_tag_search",
+        help_text="Fuzzy (trigram) search by tag name.",
+    )
+    min_price = filters.NumberFilter(field_name="effective_price", lookup_expr="gte")
+    max_price = filters.NumberFilter(field_name="effective_price", lookup_expr="lte")
+
     class Meta:
         model = Products
-        fields = ["tags"]
+        fields = ["tags", "tags_match", "tag_search", "min_price", "max_price"]
+
+    def filter_tags(self, queryset: QuerySet, name: str, value: list) -> QuerySet:
+        slugs = [slug.strip() for slug in value if slug.strip()]
+        if not slugs:
+            return queryset
+        product_ids = get_tag_product_ids(slugs=slugs)
+        if self.form.cleaned_data.get("tags_match") == TagsMatchChoices.ALL:
+            ids = frozenset.intersection(*product_ids.values())
+        else:
+            ids = frozenset.union(*product_ids.values())
+        return queryset.filter(uuid__in=ids)
+
+    def filter_tags_match(self, queryset: QuerySet, name: str, value: str) -> QuerySet:
+        # Режим применяется в filter_tags
+        return queryset
+
+    def filter_tag_search(self, queryset: QuerySet, name: str, value: str) -> QuerySet:
+        tags = Tags.objects.filter(name__trigram_word_similar=value)
+        return queryset.filter(
+            uuid__in=Products.tags.through.objects.filter(tags__in=tags).values(
+                "products_id"
+            )
+        )
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    """
+    Полнотекстовый поиск ?q= по хранимому Products.search_vector (GIN-индекс).
+    Должен стоять после OrderingFilter: без явного ?ordering= результаты
+    сортируются по релевантности (rank), с ним — как попросил клиент.
+    """
+
+    search_param = "q"
+    ordering_param = "ordering"
+
+    def filter_queryset(self, request: Request, queryset: QuerySet, view) -> QuerySet:
+        search = request.query_params.get(self.search_param, "").strip()
+        if not search:
+            return queryset
+        query = SearchQuery(
+            search, search_type="websearch", config=PRODUCT_SEARCH_CONFIG
+        )
+        queryset = queryset.filter(search_vector=query).annotate(
+            # ts_rank отдаёт real; double precision точно переживает курсор
+            rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+        )
+        if self.ordering_param not in request.query_params:
+            queryset = queryset.order_by("-rank")
+        return queryset
+
+    def get_schema_operation_parameters(self, view) -> list:
+        return [
+            {
+                "name": self.search_param,
+                "required": False,
+                "in": "query",
+                "description": "Full-text search by name and description, ordered by rank.",
+                "schema": {"type": "string"},
+            }
+        ]
+
+
+class OrderHistoryFilter(filters.FilterSet):
+    status = filters.MultipleChoiceFilter(
+        choices=OrderStatusChoices.choices,
+        help_text="Order status, can be repeated: ?status=PAID&status=SUCCESS.",
+    )
+    created_after = filters.IsoDateTimeFilter(
+        field_name="created_timestamp", lookup_expr="gte"
+    )
+    created_before = filters.IsoDateTimeFilter(
+        field_name="created_timestamp", lookup_expr="lte"
+    )
+
+    class Meta:
+        model = Orders
+        fields = ["status", "created_after", "created_before"]
@@ -0,0 +1,190 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+from inspect import iscoroutinefunction
+from typing import Callable, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# Заголовок ответа, восстановленного из IdempotencyKey
+IDEMPOTENCY_REPLAYED_HEADER = "Idempotent-Replayed"
+
+IDEMPOTENCY_KEY_PARAMETER = OpenApiParameter(
+    name=IDEMPOTENCY_KEY_HEADER,
+    type=str,
+    location=OpenApiParameter.HEADER,
+    description="Повтор запроса с тем же ключом вернёт сохранённый ответ",
+)
+
+
+class IdempotencyKeyMismatch(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "Idempotency-Key was already used with a different request."
+    default_code = "idempotency_key_mismatch"
+
+
+def get_caller(request: Request) -> str:
+    """
+    Клиент API — chat_id (query string или тело): одинаковые Idempotency-Key
+    разных клиентов не пересекаются
+    """
+    chat_id = request.query_params.get("chat_id")
+    if chat_id is None and hasattr(request.data, "get"):
+        chat_id = request.data.get("chat_id")
+    return "" if chat_id is None else str(chat_id)
+
+
+class IdempotentRequest:
+    """
+    Запрос с Idempotency-Key. Ключ — sha256 от метода, пути, chat_id клиента
+    и значения заголовка. Пока первый запрос выполняется, он держит
+    pg_advisory_lock по ключу — параллельные дубли ждут его и получают
+    сохранённый ответ.
+    """
+
+    def __init__(self, request: Request, header: str):
+        path = request.path.encode()
+        caller = get_caller(request).encode()
+        self.key = hashlib.sha256(
+            b"\0".join([request.method.encode(), path, caller, header.encode()])
+        ).hexdigest()
+        body = json.dumps(request.data, sort_keys=True, default=str).encode()
+        self.request_hash = hashlib.sha256(
+            b"\0".join([request.get_full_path().encode(), body])
+        ).hexdigest()
+        # bigint для advisory lock
+        self.lock_id = int.from_bytes(bytes.fromhex(self.key[:16]), signed=True)
+
+    def lock(self) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", [self.lock_id])
+
+    def unlock(self) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", [self.lock_id])
+
+    def replay(self) -> Optional[Response]:
+        """
+        None — ответа нет или он старше IDEMPOTENCY_KEY_TTL
+        """
+        expires_after = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        stored = IdempotencyKey.objects.filter(
+            key=self.key, created_at__gte=expires_after
+        ).first()
+        if stored is None:
+            return None
+        if stored.request_hash != self.request_hash:
+            raise IdempotencyKeyMismatch()
+        return Response(
+            stored.response,
+            status=stored.status_code,
+            headers={IDEMPOTENCY_REPLAYED_HEADER: "true"},
+        )
+
+    def store(self, response: Response) -> None:
+        """
+        5xx не сохраняется — повтор выполнит запрос заново
+        """
+        if response.status_code >= 500:
+            return
+        IdempotencyKey.objects.bulk_create(
+            [
+                IdempotencyKey(
+                    key=self.key,
+                    request_hash=self.request_hash,
+                    status_code=response.status_code,
+                    response=response.data,
+                    created_at=timezone.now(),
+                )
+            ],
+            update_conflicts=True,
+            unique_fields=["key"],
+            update_fields=["request_hash", "status_code", "response", "created_at"],
+        )
+
+
+def get_idempotent_request(request: Request) -> Optional[IdempotentRequest]:
+    header = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+    if not header:
+        return None
+    if len(header) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise ValidationError(
+            {
+                IDEMPOTENCY_KEY_HEADER: [
+                    f"Ensure this header has no more than "
+                    f"{IDEMPOTENCY_KEY_MAX_LENGTH} characters."
+                ]
+            }
+        )
+    return IdempotentRequest(request, header)
+
+
+def idempotent(view_method: Callable) -> Callable:
+    """
+    Декоратор для изменяющих action во ViewSet (sync и async): с заголовком
+    Idempotency-Key повтор запроса возвращает сохранённый ответ с заголовком
+    Idempotent-Replayed, не выполняя action. Исключения (4xx из
+    ValidationError/NotFound) не сохраняются — повтор их просто повторит.
+
+    Ставится над @query_budget: свои 3-4 запроса в бюджет action не входят.
+    """
+
+    if iscoroutinefunction(view_method):
+
+        @wraps(view_method)
+        async def async_wrapper(self, request, *args, **kwargs):
+            idempotent_request = get_idempotent_request(request)
+            if idempotent_request is None:
+                return await view_method(self, request, *args, **kwargs)
+
+            await sync_to_async(idempotent_request.lock)()
+            try:
+                response = await sync_to_async(idempotent_request.replay)()
+                if response is None:
+                    response = await view_method(self, request, *args, **kwargs)
+                    await sync_to_async(idempotent_request.store)(response)
+                return response
+            finally:
+                await sync_to_async(idempotent_request.unlock)()
+
+        return async_wrapper
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        idempotent_request = get_idempotent_request(request)
+        if idempotent_request is None:
+            return view_method(self, request, *args, **kwargs)
+
+        idempotent_request.lock()
+        try:
+            response = idempotent_request.replay()
+            if response is None:
+                response = view_method(self, request, *args, **kwargs)
+                idempotent_request.store(response)
+            return response
+        finally:
+            idempotent_request.unlock()
+
+    return wrapper
+
+
+def prune_idempotency_keys() -> int:
+    """
+    Удаляет ответы старше IDEMPOTENCY_KEY_TTL, возвращает их число
+    """
+    expires_after = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=expires_after).delete()
+    return deleted
@@ -0,0 +1,103 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+
+from .cache import bump_catalog_version
+from .models import ProductImage
+from .snapshots import mark_snapshot_dirty
+
+log = logging.getLogger(__name__)
+
+# Максимальная сторона каждого варианта в пикселях
+IMAGE_VARIANT_SIZES = {
+    "thumbnail": 200,
+    "card": 600,
+    "full": 1600,
+}
+# формат -> (расширение, параметры Pillow)
+IMAGE_VARIANT_FORMATS = {
+    "webp": ("webp", {"format": "WEBP", "quality": 80, "method": 4}),
+    "jpeg": ("jpg", {"format": "JPEG", "quality": 82, "optimize": True}),
+}
+IMAGE_VARIANTS_PATH = "product/images/variants"
+
+executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-variants")
+
+
+def variants_are_actual(image: ProductImage) -> bool:
+    return bool(image.file) and image.variants.get("source") == image.file.name
+
+
+def render_variant(source: Image.Image, max_side: int, options: dict) -> bytes:
+    variant = source.copy()
+    variant.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    if options["format"] == "JPEG" and variant.mode != "RGB":
+        variant = variant.convert("RGB")
+    buffer = BytesIO()
+    variant.save(buffer, **options)
+    return buffer.getvalue()
+
+
+def delete_variant_files(variants: dict) -> None:
+    for formats in variants.get("sizes", {}).values():
+        for name in formats.values():
+            default_storage.delete(name)
+
+
+def generate_variants(image: ProductImage) -> Dict:
+    """
+    Генерирует все варианты изображения, сохраняет их через default_storage и
+    записывает пути в ProductImage.variants одним UPDATE (без post_save).
+
+    Формат ProductImage.variants:
+        {
+            "source": "product/images/original.png",
+            "sizes": {"thumbnail": {"webp": "...", "jpeg": "..."}, ...}
+        }
+    """
+    with image.file.open("rb") as file:
+        source = ImageOps.exif_transpose(Image.open(file))
+        source.load()
+
+    sizes = {}
+    for size_name, max_side in IMAGE_VARIANT_SIZES.items():
+        sizes[size_name] = {}
+        for format_name, (extension, options) in IMAGE_VARIANT_FORMATS.items():
+            name = f"{IMAGE_VARIANTS_PATH}/{image.uuid}/{size_name}.{extension}"
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            content = ContentFile(render_variant(source, max_side, options))
+            sizes[size_name][format_name] = default_storage.save(name, content)
+
+    variants = {"source": image.file.name, "sizes": sizes}
+    ProductImage.objects.filter(pk=image.pk).update(variants=variants)
+    image.variants = variants
+    mark_snapshot_dirty(product_ids=[image.product_id])
+    bump_catalog_version()
+    return variants
+
+
+def generate_variants_job(image_pk) -> None:
+    close_old_connections()
+    try:
+        image = ProductImage.objects.filter(pk=image_pk).first()
+        if image is not None and not variants_are_actual(image):
+            generate_variants(image)
+    except Exception:
+        log.exception("Failed to generate variants for ProductImage %s", image_pk)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(image: ProductImage) -> None:
+    """
+    Генерация вне request path: задача уходит в пул потоков. То, что не
+    успело или упало, добирает команда generate_image_variants.
+    """
+    executor.submit(generate_variants_job, image.pk)
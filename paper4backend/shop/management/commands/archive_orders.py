@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from shop.archive import (
+    OrdersArchiver,
+    create_partitions,
+    get_detached_partitions,
+    month_start,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move finished orders into monthly partitions of the orders archive, "
+        "detach old archive partitions and export them to storage as csv.gz"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=6,
+            help="Archive finished orders created more than N months ago",
+        )
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=1,
+            help="Create archive partitions up to N months after the cut-off",
+        )
+        parser.add_argument(
+            "--detach-older-than",
+            type=int,
+            default=0,
+            help="Detach archive partitions older than N months (0 — keep all)",
+        )
+        parser.add_argument(
+            "--export",
+            action="store_true",
+            help="Export detached partitions to storage and drop them",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options) -> None:
+        now = timezone.now()
+        before = month_start(now, -options["older_than"])
+        created = create_partitions(before, month_start(before, options["ahead"]))
+        for name in created:
+            self.stdout.write(f"Created partition {name}")
+
+        started = time.monotonic()
+        archiver = OrdersArchiver(before=before, chunk_size=options["chunk_size"])
+        archived = sum(archiver.archive())
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {archived} orders created before {before:%Y-%m}, "
+                f"{elapsed:.1f}s, {archived / max(elapsed, 1e-9):.0f} orders/s"
+            )
+        )
+
+        if options["detach_older_than"]:
+            detached_before = month_start(now, -options["detach_older_than"])
+            for name in archiver.detach(detached_before):
+                self.stdout.write(f"Detached partition {name}")
+        if options["export"]:
+            for name in get_detached_partitions():
+                path = archiver.export(name)
+                self.stdout.write(self.style.SUCCESS(f"Exported {name} to {path}"))
@@ -0,0 +1,112 @@
+import json
+import time
+from decimal import Decimal
+from statistics import mean
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from shop.fast_serializers import ORJSONRenderer, ProductFastSerializer
+from shop.models import Products, ProductImage, Tags
+from shop.serializers import ProductSerializer
+from shop.views import ProductsReadOnlyViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ProductSerializer + JSONRenderer with ProductFastSerializer + "
+        "ORJSONRenderer on a generated catalog (rolled back afterwards)"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--products", type=int, default=10_000)
+        parser.add_argument("--tags", type=int, default=20)
+        parser.add_argument("--images", type=int, default=2)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options) -> None:
+        with transaction.atomic():
+            self.create_catalog(options)
+            self.run(options)
+            transaction.set_rollback(True)
+
+    def create_catalog(self, options: dict) -> None:
+        tags = Tags.objects.bulk_create(
+            [Tags(name=f"bench {i}", slag=f"bench-{i}") for i in range(options["tags"])]
+        )
+        products = Products.objects.bulk_create(
+            [
+                Products(
+                    name=f"Product {i}",
+                    description="Benchmark product",
+                    price=Decimal(100 + i % 900),
+                    sale=i % 30,
+                )
+                for i in range(options["products"])
+            ],
+            batch_size=1000,
+        )
+        through = Products.tags.through
+        through.objects.bulk_create(
+            [
+                through(
+                    products_id=product.uuid, tags_id=tags[(i + j) % len(tags)].uuid
+                )
+                for i, product in enumerate(products)
+                for j in range(3)
+            ],
+            batch_size=5000,
+            ignore_conflicts=True,
+        )
+        ProductImage.objects.bulk_create(
+            [
+                ProductImage(product=product, file=f"product/images/bench-{i}-{j}.jpg")
+                for i, product in enumerate(products)
+                for j in range(options["images"])
+            ],
+            batch_size=5000,
+        )
+
+    def run(self, options: dict) -> None:
+        request = Request(RequestFactory().get("/api/v1/shop/products/"))
+        fields = ProductSerializer.Meta.fields
+        queryset = Products.objects.order_by("name", "uuid")
+
+        def drf_path() -> bytes:
+            products = queryset.prefetch_related(
+                *ProductsReadOnlyViewSet.relation_prefetches.values()
+            ).only("uuid", *ProductFastSerializer(fields).columns)
+            data = ProductSerializer(
+                products, many=True, context={"request": request}, fields=fields
+            ).data
+            return JSONRenderer().render(data)
+
+        def fast_path() -> bytes:
+            serializer = ProductFastSerializer(fields=fields, request=request)
+            data = serializer.serialize(list(serializer.values(queryset)))
+            return ORJSONRenderer().render(data)
+
+        if json.loads(drf_path()) != json.loads(fast_path()):
+            raise CommandError("Fast path output differs from ProductSerializer")
+
+        results = {}
+        for name, path in (("ProductSerializer", drf_path), ("fast path", fast_path)):
+            timings = []
+            for _ in range(options["repeat"]):
+                started = time.perf_counter()
+                path()
+                timings.append(time.perf_counter() - started)
+            results[name] = timings
+            self.stdout.write(
+                f"{name:>18}: mean {mean(timings) * 1000:.1f} ms, "
+                f"min {min(timings) * 1000:.1f} ms"
+            )
+        speedup = mean(results["ProductSerializer"]) / mean(results["fast path"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{options['products']} products, outputs match, speedup x{speedup:.1f}"
+            )
+        )
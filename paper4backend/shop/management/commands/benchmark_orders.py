@@ -0,0 +1,93 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+from typing import Optional
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Send concurrent requests to orders/ on running servers (e.g. uwsgi and "
+        "uvicorn paper4backend.asgi:application) and compare throughput"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "urls",
+            nargs="+",
+            help="Base API urls, e.g. http://127.0.0.1:8000/api/v1/shop/",
+        )
+        parser.add_argument(
+            "--chat-id", required=True, help="Profile with a CREATED order"
+        )
+        parser.add_argument(
+            "--product-id",
+            help="Also PATCH this product into the order (read-write mix)",
+        )
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--timeout", type=float, default=10)
+
+    def handle(self, *args, **options) -> None:
+        for url in options["urls"]:
+            self.run(url.rstrip("/") + "/orders/", options)
+
+    def send(self, url: str, i: int, options: dict) -> Optional[float]:
+        """
+        Время ответа в секундах, None — ошибка
+        """
+        if options["product_id"] and i % 2:
+            body = json.dumps(
+                {
+                    "chat_id": options["chat_id"],
+                    "product_id": options["product_id"],
+                    "count": i % 5 + 1,
+                }
+            ).encode()
+            request = Request(
+                url,
+                data=body,
+                method="PATCH",
+                headers={"Content-Type": "application/json"},
+            )
+        else:
+            request = Request(f"{url}?{urlencode({'chat_id': options['chat_id']})}")
+
+        started = time.perf_counter()
+        try:
+            with urlopen(request, timeout=options["timeout"]) as response:
+                response.read()
+        except (HTTPError, URLError, TimeoutError):
+            return None
+        return time.perf_counter() - started
+
+    def run(self, url: str, options: dict) -> None:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            timings = list(
+                pool.map(
+                    lambda i: self.send(url, i, options), range(options["requests"])
+                )
+            )
+        elapsed = time.perf_counter() - started
+
+        ok = sorted(timing for timing in timings if timing is not None)
+        errors = len(timings) - len(ok)
+        if len(ok) < 2:
+            self.stdout.write(self.style.ERROR(f"{url}: {errors} errors"))
+            return
+        percentiles = quantiles(ok, n=100)
+        style = self.style.WARNING if errors else self.style.SUCCESS
+        self.stdout.write(
+            style(
+                f"{url}: {len(timings) / elapsed:.0f} req/s, "
+                f"p50 {percentiles[49] * 1000:.1f} ms, "
+                f"p95 {percentiles[94] * 1000:.1f} ms, errors {errors} "
+                f"({options['concurrency']} concurrent)"
+            )
+        )
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from shop.snapshots import CatalogSnapshotBuilder, prune_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the active catalog and per-tag shards as gzip JSON to storage, "
+        "rebuilding only the shards touched since the previous snapshot"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--full", action="store_true", help="Rebuild every shard from scratch"
+        )
+        parser.add_argument(
+            "--keep", type=int, default=3, help="Snapshot versions to keep in storage"
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep running and check for changes every N seconds",
+        )
+
+    def handle(self, *args, **options) -> None:
+        builder = CatalogSnapshotBuilder(chunk_size=options["chunk_size"])
+        full = options["full"]
+        while True:
+            started = time.monotonic()
+            snapshot = builder.build(full=full)
+            full = False
+            if snapshot is None:
+                self.stdout.write("Catalog snapshot is up to date")
+            else:
+                pruned = prune_snapshots(keep=max(options["keep"], 1))
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"Built catalog snapshot {snapshot.version} "
+                        f"(rebuilt {builder.rebuilt_shards} of {len(snapshot.shards)} "
+                        f"tag shards) in {time.monotonic() - started:.1f}s, "
+                        f"pruned {pruned}"
+                    )
+                )
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
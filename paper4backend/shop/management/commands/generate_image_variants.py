@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from shop.images import generate_variants, variants_are_actual
+from shop.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/JPEG variants for existing ProductImage files"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenerate variants even if they are up to date",
+        )
+        parser.add_argument("--chunk-size", type=int, default=100)
+
+    def handle(self, *args, **options) -> None:
+        images = ProductImage.objects.exclude(file="").order_by("pk")
+        generated, skipped, failed = 0, 0, 0
+        for image in images.iterator(chunk_size=options["chunk_size"]):
+            if not options["force"] and variants_are_actual(image):
+                skipped += 1
+                continue
+            try:
+                generate_variants(image)
+                generated += 1
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f"{image.pk}: {error}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated: {generated}, up to date: {skipped}, failed: {failed}"
+            )
+        )
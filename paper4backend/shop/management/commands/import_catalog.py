@@ -0,0 +1,63 @@
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from shop.catalog_import import CatalogImporter, chunked, read_feed
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a CSV/JSONL product feed and upsert Products, Tags, tag links "
+        "and image references in fixed-size chunks (one transaction per chunk)"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("path", help="Path to the feed file")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="Feed format, guessed from the file extension by default",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--skip",
+            type=int,
+            default=0,
+            help="Skip the first N rows, to resume an interrupted import",
+        )
+
+    def handle(self, *args, **options) -> None:
+        path: str = options["path"]
+        feed_format = options["format"] or path.rsplit(".", 1)[-1].lower()
+        if feed_format not in ("csv", "jsonl"):
+            raise CommandError("Unknown feed format, pass --format csv|jsonl")
+
+        importer = CatalogImporter()
+        rows = islice(
+            read_feed(path=path, feed_format=feed_format), options["skip"], None
+        )
+        processed, imported, failed = options["skip"], 0, 0
+        started = time.monotonic()
+
+        for chunk in chunked(rows, options["chunk_size"]):
+            chunk_started = time.monotonic()
+            count, errors = importer.import_chunk(raw_rows=chunk)
+            processed += len(chunk)
+            imported += count
+            failed += len(errors)
+            for error in errors:
+                self.stderr.write(error)
+            chunk_rate = len(chunk) / max(time.monotonic() - chunk_started, 1e-9)
+            self.stdout.write(
+                f"Committed rows: {processed} (resume with --skip {processed}), "
+                f"{chunk_rate:.0f} rows/s"
+            )
+
+        elapsed = time.monotonic() - started
+        rate = (processed - options["skip"]) / max(elapsed, 1e-9)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported: {imported}, invalid: {failed}, "
+                f"{elapsed:.1f}s, {rate:.0f} rows/s"
+            )
+        )
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from shop.idempotency import prune_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = "Delete stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL"
+
+    def handle(self, *args, **options) -> None:
+        deleted = prune_idempotency_keys()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} idempotency keys"))
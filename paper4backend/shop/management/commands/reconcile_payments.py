@@ -0,0 +1,71 @@
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from shop.reconciliation import PaymentReconciler, open_text, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconcile a payment provider export (CSV or JSONL with order_id, amount, "
+        "status; .gz allowed) against orders, apply valid payment transitions "
+        "and write a mismatch report"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("path", help="Provider export file")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="Defaults to the file extension",
+        )
+        parser.add_argument(
+            "--report", default="-", help="Mismatch report CSV path, - for stdout"
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Report without applying"
+        )
+
+    def handle(self, *args, **options) -> None:
+        path = options["path"]
+        file_format = options["format"] or (
+            "jsonl" if path.removesuffix(".gz").endswith(".jsonl") else "csv"
+        )
+        report_file = (
+            sys.stdout
+            if options["report"] == "-"
+            else open(options["report"], "w", encoding="utf-8", newline="")
+        )
+        reconciler = PaymentReconciler(
+            report=csv.writer(report_file),
+            chunk_size=options["chunk_size"],
+            dry_run=options["dry_run"],
+        )
+
+        started = time.monotonic()
+        try:
+            with open_text(path) as file:
+                for _ in reconciler.reconcile(read_rows(file, file_format)):
+                    pass
+        finally:
+            if report_file is not sys.stdout:
+                report_file.close()
+
+        elapsed = time.monotonic() - started
+        stats = reconciler.stats
+        mismatches = ", ".join(
+            f"{kind}: {count}"
+            for kind, count in sorted(stats.items())
+            if kind not in ("rows", "matched", "applied")
+        )
+        style = self.style.WARNING if mismatches else self.style.SUCCESS
+        self.stderr.write(
+            style(
+                f"Rows: {stats['rows']}, matched: {stats['matched']}, "
+                f"{'would apply' if options['dry_run'] else 'applied'}: "
+                f"{stats['applied']}, mismatches: {mismatches or 'none'}, "
+                f"{elapsed:.1f}s, {stats['rows'] / max(elapsed, 1e-9):.0f} rows/s"
+            )
+        )
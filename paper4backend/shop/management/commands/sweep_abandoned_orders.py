@@ -0,0 +1,63 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from shop.sweeper import AbandonedOrdersSweeper
+
+
+class Command(BaseCommand):
+    help = (
+        "Cancel (or delete with --delete) CREATED orders older than "
+        "ABANDONED_ORDER_TTL in chunks, skipping rows locked by live requests"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--ttl",
+            type=int,
+            default=settings.ABANDONED_ORDER_TTL,
+            help="Order age in seconds",
+        )
+        parser.add_argument(
+            "--delete",
+            action="store_true",
+            help="Delete orders with their lines and payments instead of cancelling",
+        )
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument(
+            "--pause", type=float, default=0, help="Seconds to sleep between chunks"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep running and sweep every N seconds",
+        )
+
+    def handle(self, *args, **options) -> None:
+        sweeper = AbandonedOrdersSweeper(
+            ttl=options["ttl"],
+            chunk_size=options["chunk_size"],
+            delete=options["delete"],
+        )
+        action = "deleted" if options["delete"] else "cancelled"
+        while True:
+            started = time.monotonic()
+            swept, chunks = 0, 0
+            for count in sweeper.sweep():
+                swept += count
+                chunks += 1
+                self.stdout.write(f"Chunk {chunks}: {action} {count} orders")
+                if options["pause"]:
+                    time.sleep(options["pause"])
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{action.capitalize()} {swept} abandoned orders in {chunks} "
+                    f"chunks, {elapsed:.1f}s, {swept / max(elapsed, 1e-9):.0f} orders/s"
+                )
+            )
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
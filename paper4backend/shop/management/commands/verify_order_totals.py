@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from shop.models import Orders
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute order totals from their lines in batches and report orders "
+        "whose stored Orders.total has drifted"
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--fix", action="store_true", help="Overwrite drifted totals"
+        )
+
+    def handle(self, *args, **options) -> None:
+        checked, drifted = 0, 0
+        last_uuid = None
+        started = time.monotonic()
+
+        while True:
+            batch = Orders.objects.with_totals().order_by("uuid")
+            if last_uuid is not None:
+                batch = batch.filter(uuid__gt=last_uuid)
+            rows = list(
+                batch.values_list("uuid", "total", "lines_total")[
+                    : options["batch_size"]
+                ]
+            )
+            if not rows:
+                break
+
+            drift = [row for row in rows if row[1] != row[2]]
+            for uuid, total, lines_total in drift:
+                self.stdout.write(
+                    f"Order {uuid}: stored {total}, lines {lines_total}, "
+                    f"drift {total - lines_total}"
+                )
+            if drift and options["fix"]:
+                Orders.objects.filter(
+                    uuid__in=[row[0] for row in drift]
+                ).recompute_totals()
+
+            checked += len(rows)
+            drifted += len(drift)
+            last_uuid = rows[-1][0]
+
+        elapsed = time.monotonic() - started
+        style = self.style.WARNING if drifted else self.style.SUCCESS
+        self.stdout.write(
+            style(
+                f"Checked: {checked}, drifted: {drifted}"
+                f"{' (fixed)' if drifted and options['fix'] else ''}, "
+                f"{elapsed:.1f}s, {checked / max(elapsed, 1e-9):.0f} orders/s"
+            )
+        )
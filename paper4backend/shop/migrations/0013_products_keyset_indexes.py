@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0012_payment_description_payment_name"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="products",
+            index=models.Index(fields=["name", "uuid"], name="products_name_uuid_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="products",
+            index=models.Index(
+                fields=["price", "uuid"], name="products_price_uuid_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="products",
+            index=models.Index(fields=["sale", "uuid"], name="products_sale_uuid_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="products",
+            index=models.Index(
+                fields=["created_at", "uuid"], name="products_created_uuid_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="products",
+            index=models.Index(
+                fields=["updated_at", "uuid"], name="products_updated_uuid_idx"
+            ),
+        ),
+    ]
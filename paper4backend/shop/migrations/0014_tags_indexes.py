@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:48
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0013_products_keyset_indexes"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name="tags",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["name"], name="tags_name_trgm_idx", opclasses=["gin_trgm_ops"]
+            ),
+        ),
+        # Автоматическая M2M-таблица: (tags_id, products_id) для index-only
+        # выборки товаров по тегу
+        migrations.RunSQL(
+            sql="CREATE INDEX IF NOT EXISTS products_tags_tag_product_idx "
+            "ON shop_products_tags (tags_id, products_id);",
+            reverse_sql="DROP INDEX IF EXISTS products_tags_tag_product_idx;",
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:48
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0014_tags_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="products",
+            name="search_vector",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.contrib.postgres.search.CombinedSearchVector(
+                    django.contrib.postgres.search.SearchVector(
+                        "name", config="russian", weight="A"
+                    ),
+                    "||",
+                    django.contrib.postgres.search.SearchVector(
+                        "description", config="russian", weight="B"
+                    ),
+                    django.contrib.postgres.search.SearchConfig("russian"),
+                ),
+                output_field=django.contrib.postgres.search.SearchVectorField(),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="products",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="products_search_vector_idx"
+            ),
+        ),
+    ]
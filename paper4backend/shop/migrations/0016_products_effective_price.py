@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:53
+
+import django.db.models.expressions
+import django.db.models.functions.math
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0015_products_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="products",
+            name="effective_price",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.db.models.functions.math.Round(
+                    django.db.models.expressions.CombinedExpression(
+                        django.db.models.expressions.CombinedExpression(
+                            models.F("price"),
+                            "*",
+                            django.db.models.expressions.CombinedExpression(
+                                models.Value(100), "-", models.F("sale")
+                            ),
+                        ),
+                        "/",
+                        models.Value(100),
+                    ),
+                    2,
+                ),
+                output_field=models.DecimalField(decimal_places=2, max_digits=15),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="products",
+            index=models.Index(
+                fields=["effective_price", "uuid"], name="products_eff_price_uuid_idx"
+            ),
+        ),
+    ]
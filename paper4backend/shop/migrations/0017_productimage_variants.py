@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0016_products_effective_price"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productimage",
+            name="variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
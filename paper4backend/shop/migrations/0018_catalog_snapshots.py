@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0017_productimage_variants"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CatalogSnapshot",
+            fields=[
+                ("version", models.BigAutoField(primary_key=True, serialize=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("is_ready", models.BooleanField(default=False)),
+                ("catalog_file", models.CharField(blank=True)),
+                ("shards", models.JSONField(blank=True, default=dict)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="CatalogSnapshotDirtyShard",
+            fields=[
+                ("key", models.CharField(primary_key=True, serialize=False)),
+                ("marked_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
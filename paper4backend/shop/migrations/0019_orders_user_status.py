@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def cancel_duplicate_created_orders(apps, schema_editor):
+    """
+    Перед уникальным индексом у пользователя остаётся только последний
+    CREATED заказ, более старые отменяются
+    """
+    Orders = apps.get_model("shop", "Orders")
+    created = Orders.objects.filter(status="CREATED")
+    users = (
+        created.values("user")
+        .annotate(count=models.Count("uuid"))
+        .filter(count__gt=1)
+        .values_list("user", flat=True)
+    )
+    for user_id in users:
+        latest = created.filter(user_id=user_id).latest("created_timestamp")
+        created.filter(user_id=user_id).exclude(pk=latest.pk).update(status="CANCELLED")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0018_catalog_snapshots"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="orders",
+            index=models.Index(
+                fields=["user", "status"], name="orders_user_status_idx"
+            ),
+        ),
+        migrations.RunPython(
+            cancel_duplicate_created_orders, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name="orders",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status", "CREATED")),
+                fields=("user",),
+                name="orders_one_created_per_user",
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:08
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_orders_total(apps, schema_editor):
+    Orders = apps.get_model("shop", "Orders")
+    ProductToOrder = apps.get_model("shop", "ProductToOrder")
+    amount_field = models.DecimalField(max_digits=20, decimal_places=2)
+    lines_total = (
+        ProductToOrder.objects.filter(order=models.OuterRef("pk"))
+        .values("order")
+        .annotate(
+            total=models.Sum(models.F("count") * models.F("product__effective_price"))
+        )
+        .values("total")
+    )
+    Orders.objects.update(
+        total=Coalesce(
+            models.Subquery(lines_total, output_field=amount_field),
+            models.Value(Decimal("0.00")),
+            output_field=amount_field,
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0019_orders_user_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="orders",
+            name="total",
+            field=models.DecimalField(
+                decimal_places=2, default=Decimal("0.00"), editable=False, max_digits=20
+            ),
+        ),
+        migrations.RunPython(fill_orders_total, migrations.RunPython.noop),
+    ]
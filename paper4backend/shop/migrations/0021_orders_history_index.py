@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0020_orders_total"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="orders",
+            index=models.Index(
+                fields=["user", "-created_timestamp", "-uuid"],
+                name="orders_user_created_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0022_idempotency_key"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="orders",
+            index=models.Index(
+                condition=models.Q(("status", "CREATED")),
+                fields=["created_timestamp"],
+                name="orders_open_created_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:30
+
+from django.db import migrations
+
+# Архив завершённых заказов (shop.archive): секционирование по месяцам
+# created_timestamp, секции создаются командой archive_orders
+CREATE_ARCHIVE_TABLES = """
+CREATE TABLE shop_orders_archive (
+    uuid uuid NOT NULL,
+    user_id integer NOT NULL,
+    status varchar NOT NULL,
+    sender_service varchar NULL,
+    created_timestamp timestamp with time zone NOT NULL,
+    total numeric(20, 2) NOT NULL,
+    payment_uuid uuid NULL,
+    payment_status varchar NULL,
+    payment_currency varchar(3) NULL,
+    payment_timestamp timestamp with time zone NULL,
+    archived_at timestamp with time zone NOT NULL DEFAULT now(),
+    PRIMARY KEY (uuid, created_timestamp)
+) PARTITION BY RANGE (created_timestamp);
+CREATE INDEX shop_orders_archive_user_idx
+    ON shop_orders_archive (user_id, created_timestamp);
+
+CREATE TABLE shop_producttoorder_archive (
+    order_id uuid NOT NULL,
+    product_id uuid NOT NULL,
+    count integer NOT NULL,
+    created_timestamp timestamp with time zone NOT NULL,
+    PRIMARY KEY (order_id, product_id, created_timestamp)
+) PARTITION BY RANGE (created_timestamp);
+"""
+
+DROP_ARCHIVE_TABLES = """
+DROP TABLE shop_producttoorder_archive;
+DROP TABLE shop_orders_archive;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0023_orders_open_created_index"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_ARCHIVE_TABLES, DROP_ARCHIVE_TABLES),
+    ]
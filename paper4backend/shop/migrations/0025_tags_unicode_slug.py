@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0024_orders_archive"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="tags",
+            name="slag",
+            field=models.SlugField(
+                allow_unicode=True, blank=True, max_length=100, unique=True
+            ),
+        ),
+    ]
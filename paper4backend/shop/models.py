@@ -1,12 +1,74 @@
-from django.db import models
+from django.db import models, transaction
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db.models.functions import Coalesce, Round
+from decimal import Decimal
+from django.utils import timezone
 from django.utils.text import slugify
+import hashlib
 import uuid
 from shop.choices import CurrencyChoices, PaidStatusChoices, OrderStatusChoices
 
+# Конфигурация full-text поиска по каталогу (russian стеммит и латиницу)
+PRODUCT_SEARCH_CONFIG = "russian"
+# Частичный уникальный индекс: не больше одного CREATED заказа на пользователя
+ORDERS_ONE_CREATED_PER_USER = "orders_one_created_per_user"
+
 
 # Create your models here.
+# Сумма заказа: до 15 знаков цены + количество
+ORDER_TOTAL_FIELD = models.DecimalField(max_digits=20, decimal_places=2)
+
+
+def order_lines_total(order_ref: str = "pk") -> Coalesce:
+    """
+    Сумма строк заказа по effective_price (Decimal, 0.00 для пустого) —
+    подзапрос, поэтому не размножает строки при других join
+    """
+    lines_total = (
+        ProductToOrder.objects.filter(order=models.OuterRef(order_ref))
+        .values("order")
+        .annotate(
+            total=models.Sum(models.F("count") * models.F("product__effective_price"))
+        )
+        .values("total")
+    )
+    return Coalesce(
+        models.Subquery(lines_total, output_field=ORDER_TOTAL_FIELD),
+        models.Value(Decimal("0.00")),
+        output_field=ORDER_TOTAL_FIELD,
+    )
+
+
+def tag_slug(name: str) -> str:
+    """
+    Slug тега с кириллицей (каталог русский). Если от имени ничего
+    не осталось (одни знаки), slug строится из хеша имени — стабилен
+    между импортами и не пустой, поэтому не конфликтует с другими тегами
+    """
+    slug = slugify(name, allow_unicode=True)
+    return slug or f"tag-{hashlib.sha1(name.encode()).hexdigest()[:12]}"
+
+
+class OrdersQuerySet(models.QuerySet):
+    def with_totals(self) -> "OrdersQuerySet":
+        """
+        lines_total — сумма, посчитанная по строкам заказа заново.
+        Должна совпадать с хранимым Orders.total (см. verify_order_totals)
+        """
+        return self.annotate(lines_total=order_lines_total())
+
+    def recompute_totals(self) -> int:
+        """
+        Пересчитывает Orders.total одним UPDATE — для массовых изменений
+        строк и цен, где приращение по каждой строке не известно
+        """
+        return self.update(total=order_lines_total())
+
+
 class Orders(models.Model):
     uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(to=User, related_name="orders", on_delete=models.CASCADE)
@@ -18,11 +80,79 @@ class Orders(models.Model):
     )
     sender_service = models.CharField(null=True)
     created_timestamp = models.DateTimeField(auto_now_add=True)
+    # Сумма по строкам CREATED заказа: ProductToOrder.save()/delete() меняют
+    # её через F() в той же транзакции, смена цены (Products.save(),
+    # ProductsQuerySet.update()/bulk_update(), импорт каталога) пересчитывает.
+    # bulk_create/update строк ProductToOrder — только с recompute_totals().
+    # У оплаченных заказов сумма оплаты и не меняется
+    total = models.DecimalField(
+        max_digits=20, decimal_places=2, default=Decimal("0.00"), editable=False
+    )
+
+    objects = OrdersQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "status"], name="orders_user_status_idx"),
+            # История заказов: keyset по (created_timestamp, uuid) внутри user
+            models.Index(
+                fields=["user", "-created_timestamp", "-uuid"],
+                name="orders_user_created_idx",
+            ),
+            # Поиск брошенных корзин (shop.sweeper): только открытые заказы
+            models.Index(
+                fields=["created_timestamp"],
+                condition=models.Q(status=OrderStatusChoices.CREATED),
+                name="orders_open_created_idx",
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user"],
+                condition=models.Q(status=OrderStatusChoices.CREATED),
+                name=ORDERS_ONE_CREATED_PER_USER,
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"Order {self.uuid} - {self.user.username} - {self.status}"
 
 
+class ProductsQuerySet(models.QuerySet):
+    """
+    update()/bulk_update() минуют Products.save() и сигналы: если меняются
+    price или sale, суммы CREATED заказов с этими товарами пересчитываются
+    в той же транзакции
+    """
+
+    pricing_fields = {"price", "sale"}
+
+    def recompute_open_orders(self, product_ids) -> None:
+        Orders.objects.filter(
+            status=OrderStatusChoices.CREATED,
+            products__product_id__in=product_ids,
+        ).recompute_totals()
+
+    def update(self, **kwargs) -> int:
+        if self.pricing_fields.isdisjoint(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            # до UPDATE: фильтр может зависеть от самой цены
+            product_ids = list(self.values_list("pk", flat=True))
+            rows = super().update(**kwargs)
+            self.recompute_open_orders(product_ids)
+        return rows
+
+    def bulk_update(self, objs, fields, batch_size=None) -> int:
+        if self.pricing_fields.isdisjoint(fields):
+            return super().bulk_update(objs, fields, batch_size=batch_size)
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            rows = super().bulk_update(objs, fields, batch_size=batch_size)
+            self.recompute_open_orders([obj.pk for obj in objs])
+        return rows
+
+
 class Products(models.Model):
     uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(null=False, blank=False)
@@ -33,15 +163,64 @@ class Products(models.Model):
     sale = models.IntegerField(
         default=0, validators=[MinValueValidator(0), MaxValueValidator(100)]
     )
+    # Цена с учётом скидки, sale — процент. Считает Postgres, поэтому колонка
+    # актуальна и после save(), и после QuerySet.update()/bulk_update()
+    effective_price = models.GeneratedField(
+        expression=Round(models.F("price") * (100 - models.F("sale")) / 100, 2),
+        output_field=models.DecimalField(max_digits=15, decimal_places=2),
+        db_persist=True,
+    )
     is_archive = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     tags = models.ManyToManyField(to="Tags", related_name="products")
+    # Хранимая колонка, Postgres пересчитывает её сам при INSERT/UPDATE
+    search_vector = models.GeneratedField(
+        expression=SearchVector("name", weight="A", config=PRODUCT_SEARCH_CONFIG)
+        + SearchVector("description", weight="B", config=PRODUCT_SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    objects = ProductsQuerySet.as_manager()
+
+    # Композитные индексы под keyset-пагинацию: (поле сортировки, uuid)
+    class Meta:
+        indexes = [
+            GinIndex(fields=["search_vector"], name="products_search_vector_idx"),
+            models.Index(fields=["name", "uuid"], name="products_name_uuid_idx"),
+            models.Index(fields=["price", "uuid"], name="products_price_uuid_idx"),
+            models.Index(fields=["sale", "uuid"], name="products_sale_uuid_idx"),
+            models.Index(
+                fields=["effective_price", "uuid"], name="products_eff_price_uuid_idx"
+            ),
+            models.Index(
+                fields=["created_at", "uuid"], name="products_created_uuid_idx"
+            ),
+            models.Index(
+                fields=["updated_at", "uuid"], name="products_updated_uuid_idx"
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.saved_pricing = instance.get_pricing()
+        return instance
+
+    def get_pricing(self) -> tuple:
+        """
+        (price, sale) — от них зависят суммы открытых заказов.
+        __dict__, чтобы не догружать поля, отложенные через only()/defer()
+        """
+        return self.__dict__.get("price"), self.__dict__.get("sale")
 
 
 class ProductImage(models.Model):
     uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     file = models.FileField(upload_to="product/images/", null=False)
+    # Пути ресайзнутых вариантов, заполняет shop.images.generate_variants
+    variants = models.JSONField(default=dict, blank=True, editable=False)
     product = models.ForeignKey(
         to=Products, on_delete=models.CASCADE, null=True, related_name="images"
     )
@@ -60,22 +239,78 @@ class ProductToOrder(models.Model):
     class Meta:
         unique_together = ("product", "order")
 
+    def get_saved_line(self) -> tuple:
+        """
+        (order_id, product_id, count) строки в БД под SELECT ... FOR UPDATE:
+        приращение total считается от неё, а не от прочитанного раньше
+        экземпляра, иначе параллельные изменения одной строки портят сумму
+        """
+        if self.pk is None:
+            return None, None, 0
+        saved = (
+            ProductToOrder.objects.select_for_update()
+            .filter(pk=self.pk)
+            .values_list("order_id", "product_id", "count")
+            .first()
+        )
+        return saved or (None, None, 0)
+
+    @staticmethod
+    def change_order_total(order_id, product_id, count: int) -> None:
+        """
+        Orders.total += count * effective_price одним UPDATE. Только для
+        CREATED заказа: правка строк оплаченного (например, в админке) не
+        меняет списанную сумму
+        """
+        if not count:
+            return
+        price = Products.objects.filter(pk=product_id).values("effective_price")
+        Orders.objects.filter(pk=order_id, status=OrderStatusChoices.CREATED).update(
+            total=models.F("total") + count * models.Subquery(price)
+        )
+
+    def save(self, *args, **kwargs) -> None:
+        with transaction.atomic(savepoint=False):
+            old_order, old_product, old_count = self.get_saved_line()
+            super().save(*args, **kwargs)
+            if (old_order, old_product) == (self.order_id, self.product_id):
+                self.change_order_total(
+                    self.order_id, self.product_id, self.count - old_count
+                )
+            else:
+                self.change_order_total(old_order, old_product, -old_count)
+                self.change_order_total(self.order_id, self.product_id, self.count)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            order_id, product_id, count = self.get_saved_line()
+            self.change_order_total(order_id, product_id, -count)
+            return super().delete(*args, **kwargs)
+
     def __str__(self) -> str:
         return f"{self.product.name} * {self.count} in {self.order.user.username}"
 
     @property
     def amount(self) -> float:
-        return (self.product.price - self.product.sale) * self.count
+        return self.product.effective_price * self.count
 
 
 class Tags(models.Model):
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True)
     name = models.CharField(max_length=100, unique=True)
-    slag = models.SlugField(unique=True, blank=True, max_length=100)
+    slag = models.SlugField(unique=True, blank=True, max_length=100, allow_unicode=True)
+
+    class Meta:
+        indexes = [
+            # Нечёткий поиск по имени тега (trigram_word_similar)
+            GinIndex(
+                fields=["name"], name="tags_name_trgm_idx", opclasses=["gin_trgm_ops"]
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.slag:
-            self.slag = slugify(self.name)
+            self.slag = tag_slug(self.name)
         super().save(*args, **kwargs)
 
     def __str__(self) -> str:
@@ -100,7 +335,46 @@ class Payment(models.Model):
 
     @property
     def amount(self) -> float:
-        amount = 0
-        for pto in self.order.products.all():
-            amount += pto.amount
-        return float(amount)
+        return float(self.order.total)
+
+
+class CatalogSnapshot(models.Model):
+    """
+    Версия предсобранного каталога в storage: gzip JSON всех активных товаров
+    и шарды по тегам. Текущая — последняя с is_ready=True.
+
+    Формат shards: {"<uuid тега>": {"slag": "...", "file": "catalog/..."}}
+    """
+
+    version = models.BigAutoField(primary_key=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    is_ready = models.BooleanField(default=False)
+    catalog_file = models.CharField(blank=True)
+    shards = models.JSONField(default=dict, blank=True)
+
+    def __str__(self) -> str:
+        return f"Catalog snapshot {self.version}"
+
+
+class CatalogSnapshotDirtyShard(models.Model):
+    """
+    Что изменилось с прошлого snapshot'а: "product:<uuid>" или "tag:<uuid>".
+    Пишется сигналами в той же транзакции, что и изменение каталога.
+    """
+
+    key = models.CharField(primary_key=True)
+    marked_at = models.DateTimeField(auto_now_add=True)
+
+
+class IdempotencyKey(models.Model):
+    """
+    Сохранённый ответ на запрос с заголовком Idempotency-Key (shop.idempotency).
+    key — sha256 от метода, пути, chat_id и значения заголовка, request_hash —
+    от query string и тела: тот же ключ с другим запросом не воспроизводится.
+    """
+
+    key = models.CharField(primary_key=True, max_length=64)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
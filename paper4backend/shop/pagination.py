@@ -0,0 +1,185 @@
+import json
+from base64 import b64decode, b64encode
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Field, Func, QuerySet, Value
+from django.db.models.lookups import GreaterThan, LessThan
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.request import Request
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetCursor(NamedTuple):
+    ordering: str
+    value: Any
+    pk: Any
+    reverse: bool
+
+
+class Row(Func):
+    """
+    ROW(a, b) для сравнения кортежей: (price, uuid) > (%s, %s)
+    Postgres умеет отдавать такое условие прямо в индекс (price, uuid).
+    """
+
+    function = "ROW"
+    output_field = Field()
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Keyset-пагинация по одному полю сортировки + первичный ключ как tiebreaker.
+
+    В отличие от стандартного CursorPagination из DRF, курсор хранит значение
+    поля и pk последней записи, а не offset внутри одинаковых значений, поэтому
+    глубина страницы не влияет на стоимость запроса — это всегда индексный
+    range scan по (field, pk) с LIMIT page_size + 1.
+
+    Сортировка берётся из queryset (её уже применил OrderingFilter), в расчёт
+    идёт только первое поле. Направление pk совпадает с направлением поля,
+    чтобы хватало одного композитного индекса (field, pk) в обе стороны.
+
+    Пагинация включается, только если в запросе есть `cursor` или `page_size`
+    (или always_paginate), иначе эндпоинт отдаёт плоский список, как и раньше.
+    """
+
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = "page_size"
+    ordering = "name"
+    tiebreaker = "pk"
+    always_paginate = False
+
+    def paginate_queryset(
+        self, queryset: QuerySet, request: Request, view=None
+    ) -> Optional[List]:
+        if (
+            not self.always_paginate
+            and self.cursor_query_param not in request.query_params
+            and self.page_size_query_param not in request.query_params
+        ):
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+        self.page_size = self.get_page_size(request)
+        self.key_ordering = self.get_key_ordering(queryset)
+        self.key_field = self.get_key_field(queryset, self.key_ordering)
+
+        cursor = self.decode_keyset_cursor(request)
+        reverse = cursor.reverse if cursor else False
+        descending = self.key_ordering.startswith("-") != reverse
+
+        field_name = self.key_ordering.lstrip("-")
+        prefix = "-" if descending else ""
+        queryset = queryset.order_by(
+            f"{prefix}{field_name}", f"{prefix}{self.tiebreaker}"
+        )
+        if cursor is not None:
+            queryset = queryset.filter(
+                self.get_keyset_condition(field_name, cursor, descending)
+            )
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = cursor is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        return self.page
+
+    def get_key_ordering(self, queryset: QuerySet) -> str:
+        order_by = queryset.query.order_by or queryset.model._meta.ordering
+        ordering = order_by[0] if order_by else self.ordering
+        if not isinstance(ordering, str):
+            raise NotFound(self.invalid_cursor_message)
+        return ordering
+
+    def get_key_field(self, queryset: QuerySet, ordering: str) -> Field:
+        name = ordering.lstrip("-")
+        # Сортировка по аннотации (например, rank полнотекстового поиска)
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    def get_keyset_condition(
+        self, field_name: str, cursor: KeysetCursor, descending: bool
+    ):
+        pk_field = self.model._meta.pk
+        lookup = LessThan if descending else GreaterThan
+        return lookup(
+            Row(field_name, self.tiebreaker),
+            Row(
+                Value(cursor.value, output_field=self.key_field),
+                Value(cursor.pk, output_field=pk_field),
+            ),
+        )
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.has_next:
+            return None
+        return self.encode_keyset_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self) -> Optional[str]:
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_keyset_cursor(self.page[0], reverse=True)
+
+    def decode_keyset_cursor(self, request: Request) -> Optional[KeysetCursor]:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(b64decode(encoded.encode("ascii")).decode("utf-8"))
+            cursor = KeysetCursor(
+                ordering=data["o"],
+                value=self.key_field.to_python(data["v"]),
+                pk=self.model._meta.pk.to_python(data["pk"]),
+                reverse=bool(data["r"]),
+            )
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        # Курсор выписан для другой сортировки — продолжать по нему нельзя
+        if cursor.ordering != self.key_ordering:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_keyset_cursor(self, instance, reverse: bool) -> str:
+        value, pk = self.get_position(instance)
+        data = {"o": self.key_ordering, "v": value, "pk": pk, "r": int(reverse)}
+        encoded = b64encode(json.dumps(data).encode("utf-8")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_position(self, instance) -> Tuple[Any, str]:
+        name = self.key_ordering.lstrip("-")
+        # Строки values() (быстрый путь сериализации) — это dict, не модель
+        if isinstance(instance, dict):
+            value, pk = instance[name], instance[self.model._meta.pk.attname]
+        else:
+            value, pk = getattr(instance, name), instance.pk
+        # Без потери точности: DjangoJSONEncoder обрезает микросекунды
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        return value, str(pk)
+
+
+class ProductKeysetPagination(KeysetPagination):
+    page_size = 20
+    max_page_size = 100
+    ordering = "name"
+
+
+class OrderHistoryPagination(KeysetPagination):
+    page_size = 20
+    max_page_size = 100
+    ordering = "-created_timestamp"
+    always_paginate = True
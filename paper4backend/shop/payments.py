@@ -0,0 +1,99 @@
+from typing import Dict, Iterable, NamedTuple, Optional, Set
+from uuid import UUID
+
+from django.db import transaction
+
+from .choices import OrderStatusChoices, PaidStatusChoices
+from .models import Orders, Payment
+from .resolvers import chat_resolver
+
+# Допустимые переходы: статус -> куда из него можно перейти
+PAYMENT_TRANSITIONS: Dict[str, Set[str]] = {
+    PaidStatusChoices.CREATED: {PaidStatusChoices.PAID, PaidStatusChoices.FAILED},
+    # Повторная попытка после неудачной оплаты
+    PaidStatusChoices.FAILED: {PaidStatusChoices.PAID},
+    PaidStatusChoices.PAID: set(),
+}
+ORDER_TRANSITIONS: Dict[str, Set[str]] = {
+    OrderStatusChoices.CREATED: {OrderStatusChoices.PAID, OrderStatusChoices.CANCELLED},
+    OrderStatusChoices.PAID: {
+        OrderStatusChoices.PROCESSED,
+        OrderStatusChoices.CANCELLED,
+    },
+    OrderStatusChoices.PROCESSED: {
+        OrderStatusChoices.SUCCESS,
+        OrderStatusChoices.FAILED,
+    },
+    OrderStatusChoices.SUCCESS: {OrderStatusChoices.RETURNED},
+    OrderStatusChoices.CANCELLED: set(),
+    OrderStatusChoices.FAILED: set(),
+    OrderStatusChoices.RETURNED: set(),
+}
+# Куда переходит заказ вместе с оплатой; None — заказ остаётся CREATED
+ORDER_STATUS_BY_PAYMENT: Dict[str, Optional[str]] = {
+    PaidStatusChoices.PAID: OrderStatusChoices.PAID,
+    PaidStatusChoices.FAILED: None,
+}
+
+
+class PaymentTransition(NamedTuple):
+    order_id: UUID
+    # False — переход недопустим из текущих статусов, ничего не изменено
+    applied: bool
+    # Статусы после попытки
+    order_status: str
+    payment_status: str
+
+
+def can_change_payment(order_status: str, payment_status: str, status: str) -> bool:
+    """
+    Оплата меняется, только пока заказ её ждёт (CREATED)
+    """
+    if order_status != OrderStatusChoices.CREATED:
+        return False
+    if status not in PAYMENT_TRANSITIONS[payment_status]:
+        return False
+    order_target = ORDER_STATUS_BY_PAYMENT[status]
+    return order_target is None or order_target in ORDER_TRANSITIONS[order_status]
+
+
+def apply_payment_status(
+    order_ids: Iterable, status: str
+) -> Dict[UUID, PaymentTransition]:
+    """
+    Переводит оплату заказов в status, а заказы — в ORDER_STATUS_BY_PAYMENT,
+    одной транзакцией: строки Payment и Orders берутся SELECT ... FOR UPDATE
+    (в порядке uuid, чтобы пачки не ловили deadlock), затем по одному UPDATE
+    на таблицу для всех допустимых переходов. Параллельное сообщение о том же
+    заказе ждёт блокировку и видит уже новый статус.
+
+    Заказов без Payment в результате нет.
+    """
+    order_target = ORDER_STATUS_BY_PAYMENT[status]
+    with transaction.atomic():
+        rows = list(
+            Payment.objects.select_for_update()
+            .filter(order_id__in=list(order_ids))
+            .order_by("order_id")
+            .values_list("order_id", "order__user_id", "order__status", "status")
+        )
+        result, user_ids = {}, set()
+        for order_id, user_id, order_status, payment_status in rows:
+            if can_change_payment(order_status, payment_status, status):
+                result[order_id] = PaymentTransition(
+                    order_id, True, order_target or order_status, status
+                )
+                user_ids.add(user_id)
+            else:
+                result[order_id] = PaymentTransition(
+                    order_id, False, order_status, payment_status
+                )
+
+        applied = [order_id for order_id, item in result.items() if item.applied]
+        if applied:
+            Payment.objects.filter(order_id__in=applied).update(status=status)
+        if applied and order_target is not None:
+            Orders.objects.filter(uuid__in=applied).update(status=order_target)
+            # update() сигналов не шлёт, а открытый заказ пользователей сменился
+            transaction.on_commit(lambda: chat_resolver.invalidate_users(user_ids))
+    return result
@@ -0,0 +1,147 @@
+import csv
+import gzip
+import json
+from collections import Counter, defaultdict
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from .choices import PaidStatusChoices
+from .models import Orders
+from .payments import apply_payment_status, can_change_payment
+
+# Поля строки выгрузки провайдера
+ORDER_FIELD, AMOUNT_FIELD, STATUS_FIELD = "order_id", "amount", "status"
+REPORT_FIELDS = ["order_id", "kind", "provider", "ours", "detail"]
+
+INVALID_ROW = "invalid_row"
+UNKNOWN_ORDER = "unknown_order"
+AMOUNT_MISMATCH = "amount_mismatch"
+STATUS_CONFLICT = "status_conflict"
+
+
+def open_text(path: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def read_rows(file: IO[str], file_format: str) -> Iterator[dict]:
+    """
+    Построчно, без чтения файла целиком. file_format: csv (с заголовком) или jsonl
+    """
+    if file_format == "csv":
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # Без полей -> invalid_row в отчёте
+            yield {}
+
+
+class PaymentReconciler:
+    """
+    Сверяет выгрузку провайдера (order_id, amount, status) с Orders.total и
+    Payment.status пачками по chunk_size: один запрос uuid__in на пачку и
+    apply_payment_status для допустимых переходов. Расхождения пишутся
+    в report (csv.writer) по мере обработки, поэтому память не зависит от
+    размера файла.
+
+    Суммы сравниваются с точностью до копейки. При расхождении суммы
+    статус не применяется.
+    """
+
+    def __init__(self, report, chunk_size: int = 1000, dry_run: bool = False):
+        self.report = report
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.stats = Counter()
+
+    def mismatch(
+        self, order_id, kind: str, provider="", ours="", detail: str = ""
+    ) -> None:
+        self.stats[kind] += 1
+        self.report.writerow([order_id, kind, provider, ours, detail])
+
+    def parse(self, row: dict) -> Optional[Tuple[UUID, Decimal, str]]:
+        try:
+            order_id = UUID(str(row[ORDER_FIELD]))
+            amount = Decimal(str(row[AMOUNT_FIELD])).quantize(Decimal("0.01"))
+            status = str(row[STATUS_FIELD]).upper()
+        except (KeyError, ValueError, InvalidOperation) as error:
+            self.mismatch(row.get(ORDER_FIELD, ""), INVALID_ROW, detail=repr(error))
+            return None
+        if status not in PaidStatusChoices.values:
+            self.mismatch(order_id, INVALID_ROW, provider=status, detail="status")
+            return None
+        return order_id, amount, status
+
+    def reconcile_chunk(self, rows: List[dict]) -> None:
+        provider: Dict[UUID, Tuple[Decimal, str]] = {}
+        for row in rows:
+            parsed = self.parse(row)
+            if parsed is None:
+                continue
+            order_id, amount, status = parsed
+            if order_id in provider:
+                self.mismatch(order_id, INVALID_ROW, detail="duplicate row")
+            provider[order_id] = (amount, status)
+
+        ours = {
+            order_id: (total, order_status, payment_status)
+            for order_id, total, order_status, payment_status in Orders.objects.filter(
+                uuid__in=list(provider), payment__isnull=False
+            ).values_list("uuid", "total", "status", "payment__status")
+        }
+        to_apply = defaultdict(list)
+        for order_id, (amount, status) in provider.items():
+            if order_id not in ours:
+                self.mismatch(order_id, UNKNOWN_ORDER, provider=status)
+                continue
+            total, order_status, payment_status = ours[order_id]
+            if amount != total:
+                self.mismatch(order_id, AMOUNT_MISMATCH, provider=amount, ours=total)
+            elif status == payment_status:
+                self.stats["matched"] += 1
+            elif can_change_payment(order_status, payment_status, status):
+                to_apply[status].append(order_id)
+            else:
+                self.mismatch(
+                    order_id,
+                    STATUS_CONFLICT,
+                    provider=status,
+                    ours=payment_status,
+                    detail=f"order {order_status}",
+                )
+
+        for status, order_ids in to_apply.items():
+            if self.dry_run:
+                self.stats["applied"] += len(order_ids)
+                continue
+            for transition in apply_payment_status(order_ids, status).values():
+                if transition.applied:
+                    self.stats["applied"] += 1
+                else:
+                    # Статус поменялся между сверкой и блокировкой
+                    self.mismatch(
+                        transition.order_id,
+                        STATUS_CONFLICT,
+                        provider=status,
+                        ours=transition.payment_status,
+                        detail=f"order {transition.order_status}",
+                    )
+
+    def reconcile(self, rows: Iterator[dict]) -> Iterator[int]:
+        """
+        Генератор: после каждой пачки отдаёт число строк в ней
+        """
+        self.report.writerow(REPORT_FIELDS)
+        while chunk := list(islice(rows, self.chunk_size)):
+            self.reconcile_chunk(chunk)
+            self.stats["rows"] += len(chunk)
+            yield len(chunk)
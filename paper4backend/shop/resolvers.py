@@ -0,0 +1,217 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from django.db.models import OuterRef, QuerySet, Subquery
+
+from paper4auth.models import Profile
+from .choices import OrderStatusChoices
+from .models import Orders
+
+
+class ChatContext(NamedTuple):
+    user_id: int
+    # uuid CREATED заказа пользователя, None — открытого заказа нет
+    order_id: Optional[UUID]
+
+
+class ChatResolver:
+    """
+    chat_id -> пользователь и его открытый заказ, из БД одним запросом.
+
+    Два уровня кеша:
+        - LRU в памяти процесса, CHAT_RESOLVER_CACHE_SIZE записей. Записи живут
+          CHAT_RESOLVER_LOCAL_TIMEOUT секунд — столько другой воркер может
+          видеть устаревший заказ после изменения в этом процессе;
+        - общий кеш CHAT_RESOLVER_CACHE_ALIAS (по умолчанию DummyCache, т.е.
+          выключен), сбрасывается сразу.
+
+    Сигналы Orders и Profile вызывают invalidate_user/invalidate после коммита.
+    QuerySet.update() сигналов не шлёт — после него invalidate_user вызывать
+    вручную. Сброс из другого процесса до LRU этого процесса не доходит,
+    поэтому перед ответом "нет открытого заказа" запись перечитывается из БД
+    (resolve_order, refresh).
+    """
+
+    prefix = "chat:resolver"
+
+    def __init__(self):
+        # chat_id -> (истекает в, ChatContext)
+        self.local: OrderedDict[str, Tuple[float, ChatContext]] = OrderedDict()
+        # user_id -> chat_id для сброса по изменению заказа без запроса в БД
+        self.chat_ids: Dict[int, str] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def shared(self) -> BaseCache:
+        return caches[settings.CHAT_RESOLVER_CACHE_ALIAS]
+
+    def get_key(self, chat_id: str) -> str:
+        return f"{self.prefix}:{chat_id}"
+
+    def resolve(self, chat_id: str | int) -> Optional[ChatContext]:
+        """
+        None — профиля с таким chat_id нет (отрицательный ответ не кешируется)
+        """
+        chat_id = str(chat_id)
+        context = self.get_local(chat_id)
+        if context is not None:
+            return context
+
+        cached = self.shared.get(self.get_key(chat_id))
+        if cached is not None:
+            context = ChatContext(*cached)
+        else:
+            context = self.fetch(chat_id)
+            if context is None:
+                return None
+            self.shared.set(
+                self.get_key(chat_id),
+                tuple(context),
+                timeout=settings.CHAT_RESOLVER_CACHE_TIMEOUT,
+            )
+        self.set_local(chat_id, context)
+        return context
+
+    async def aresolve(self, chat_id: str | int) -> Optional[ChatContext]:
+        """
+        resolve() для async view: тот же LRU, общий кеш и запрос через aget/afirst
+        """
+        chat_id = str(chat_id)
+        context = self.get_local(chat_id)
+        if context is not None:
+            return context
+
+        cached = await self.shared.aget(self.get_key(chat_id))
+        if cached is not None:
+            context = ChatContext(*cached)
+        else:
+            row = await self.get_fetch_queryset(chat_id).afirst()
+            if row is None:
+                return None
+            context = ChatContext(*row)
+            await self.shared.aset(
+                self.get_key(chat_id),
+                tuple(context),
+                timeout=settings.CHAT_RESOLVER_CACHE_TIMEOUT,
+            )
+        self.set_local(chat_id, context)
+        return context
+
+    def resolve_order(self, chat_id: str | int) -> Optional[ChatContext]:
+        """
+        resolve(), но закешированное "открытого заказа нет" перепроверяется
+        в БД: заказ мог создать другой процесс
+        """
+        context = self.resolve(chat_id)
+        if context is not None and context.order_id is None:
+            context = self.refresh(chat_id)
+        return context
+
+    async def aresolve_order(self, chat_id: str | int) -> Optional[ChatContext]:
+        context = await self.aresolve(chat_id)
+        if context is not None and context.order_id is None:
+            context = await self.arefresh(chat_id)
+        return context
+
+    def refresh(self, chat_id: str | int) -> Optional[ChatContext]:
+        """
+        Сбрасывает оба уровня кеша и читает chat_id из БД
+        """
+        self.invalidate(chat_id)
+        return self.resolve(chat_id)
+
+    async def arefresh(self, chat_id: str | int) -> Optional[ChatContext]:
+        chat_id = str(chat_id)
+        with self.lock:
+            self.pop_local(chat_id)
+        await self.shared.adelete(self.get_key(chat_id))
+        return await self.aresolve(chat_id)
+
+    def get_fetch_queryset(self, chat_id: str) -> QuerySet:
+        open_order = Orders.objects.filter(
+            user_id=OuterRef("user_id"), status=OrderStatusChoices.CREATED
+        ).values("uuid")[:1]
+        return (
+            Profile.objects.filter(chat_id=chat_id)
+            .annotate(order_id=Subquery(open_order))
+            .values_list("user_id", "order_id")
+        )
+
+    def fetch(self, chat_id: str) -> Optional[ChatContext]:
+        row = self.get_fetch_queryset(chat_id).first()
+        return ChatContext(*row) if row is not None else None
+
+    def get_local(self, chat_id: str) -> Optional[ChatContext]:
+        with self.lock:
+            entry = self.local.get(chat_id)
+            if entry is None:
+                return None
+            expires_at, context = entry
+            if expires_at < time.monotonic():
+                self.pop_local(chat_id)
+                return None
+            self.local.move_to_end(chat_id)
+            return context
+
+    def set_local(self, chat_id: str, context: ChatContext) -> None:
+        expires_at = time.monotonic() + settings.CHAT_RESOLVER_LOCAL_TIMEOUT
+        with self.lock:
+            self.local[chat_id] = (expires_at, context)
+            self.local.move_to_end(chat_id)
+            self.chat_ids[context.user_id] = chat_id
+            while len(self.local) > settings.CHAT_RESOLVER_CACHE_SIZE:
+                self.pop_local(next(iter(self.local)))
+
+    def pop_local(self, chat_id: str) -> None:
+        """
+        Вызывать под self.lock
+        """
+        entry = self.local.pop(chat_id, None)
+        if entry is not None and self.chat_ids.get(entry[1].user_id) == chat_id:
+            del self.chat_ids[entry[1].user_id]
+
+    def invalidate(self, chat_id: str | int) -> None:
+        chat_id = str(chat_id)
+        with self.lock:
+            self.pop_local(chat_id)
+        self.shared.delete(self.get_key(chat_id))
+
+    def invalidate_user(self, user_id: int) -> None:
+        chat_id = self.chat_ids.get(user_id)
+        if chat_id is None:
+            chat_id = (
+                Profile.objects.filter(user_id=user_id)
+                .values_list("chat_id", flat=True)
+                .first()
+            )
+        if chat_id is not None:
+            self.invalidate(chat_id)
+
+    def invalidate_users(self, user_ids: Iterable[int]) -> None:
+        """
+        invalidate_user для многих пользователей: один запрос chat_id и
+        delete_many в общем кеше
+        """
+        chat_ids = list(
+            Profile.objects.filter(user_id__in=list(user_ids)).values_list(
+                "chat_id", flat=True
+            )
+        )
+        with self.lock:
+            for chat_id in chat_ids:
+                self.pop_local(str(chat_id))
+        self.shared.delete_many([self.get_key(chat_id) for chat_id in chat_ids])
+
+    def clear(self) -> None:
+        with self.lock:
+            self.local.clear()
+            self.chat_ids.clear()
+
+
+chat_resolver = ChatResolver()
@@ -1,23 +1,28 @@
 from rest_framework.serializers import (
     ModelSerializer,
     CharField,
+    DecimalField,
     IntegerField,
     UUIDField,
     Serializer,
     SerializerMethodField,
 )
-from rest_framework.exceptions import ValidationError
-from django.shortcuts import get_object_or_404, get_list_or_404
+from rest_framework.exceptions import NotFound, ValidationError
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import QuerySet
+from drf_spectacular.utils import extend_schema_field
+from typing import Dict, List, Optional
 from .models import (
     Products,
     ProductImage,
     Tags,
     Orders,
     ProductToOrder,
-    OrderStatusChoices,
     Payment,
 )
-from paper4auth.models import Profile
+from .resolvers import ChatContext, chat_resolver
+from .utils import create_open_order, lock_open_order
 
 
 class PaymentSerializer(ModelSerializer):
@@ -31,10 +36,33 @@ class PaymentSerializer(ModelSerializer):
         return obj.amount
 
 
+def build_variant_urls(variants: dict, request=None) -> Dict[str, Dict[str, str]]:
+    urls = {}
+    for size, formats in variants.get("sizes", {}).items():
+        urls[size] = {}
+        for format_name, name in formats.items():
+            url = default_storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[size][format_name] = url
+    return urls
+
+
 class ProductImageSerializer(ModelSerializer):
+    variants = SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ["file"]
+        fields = ["file", "variants"]
+
+    def get_variants(self, obj: ProductImage) -> Dict[str, Dict[str, str]]:
+        """
+        {"thumbnail": {"webp": url, "jpeg": url}, "card": {...}, "full": {...}},
+        пусто, пока варианты ещё не сгенерированы
+        """
+        return build_variant_urls(
+            variants=obj.variants, request=self.context.get("request")
+        )
 
 
 class TagSerializer(ModelSerializer):
@@ -43,9 +71,23 @@ class TagSerializer(ModelSerializer):
         fields = ["name", "slag"]
 
 
-class ProductSerializer(ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Sparse fieldsets: сериализатор оставляет только поля из `fields`
+    (порядок берётся из Meta.fields). Используется с ?fields= / ?omit=.
+    """
+
+    def __init__(self, *args, fields: Optional[List[str]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class ProductSerializer(SparseFieldsMixin, ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
+    effective_price = DecimalField(max_digits=15, decimal_places=2, read_only=True)
 
     class Meta:
         fields = [
@@ -53,6 +95,7 @@ class ProductSerializer(ModelSerializer):
             "description",
             "price",
             "sale",
+            "effective_price",
             "created_at",
             "updated_at",
             "is_archive",
@@ -62,6 +105,28 @@ class ProductSerializer(ModelSerializer):
         model = Products
 
 
+class ProductCardSerializer(ModelSerializer):
+    """
+    Компактная карточка для выбора товара в боте: имя, цена и первая картинка
+    """
+
+    image = SerializerMethodField()
+
+    class Meta:
+        fields = ["name", "price", "image"]
+        model = Products
+
+    @extend_schema_field(ProductImageSerializer(allow_null=True))
+    def get_image(self, obj: Products) -> Optional[dict]:
+        # first_images кладёт Prefetch во ProductsReadOnlyViewSet
+        images = getattr(obj, "first_images", None)
+        if images is None:
+            images = obj.images.order_by("pk")[:1]
+        if not images:
+            return None
+        return ProductImageSerializer(images[0], context=self.context).data
+
+
 class ProductToOrderSerializer(ModelSerializer):
     class Meta:
         fields = ["count", "product", "order"]
@@ -100,25 +165,105 @@ class OrderSerializer(ModelSerializer):
         model = Orders
 
     def validate_chat_id(self, value: str | int) -> str | int:
-        if not Profile.objects.filter(chat_id=value).exists():
+        if chat_resolver.resolve(value) is None:
             raise ValidationError(detail="Invalid chat_id.")
         return value
 
-    def get_created_orders_by_profile(self, profile: Profile) -> Orders | None:
-        return Orders.objects.filter(
-            user__profiling=profile, status=OrderStatusChoices.CREATED
-        ).first()
-
     def create(self, validated_data: dict) -> Orders:
         chat_id: str | int = validated_data.pop("chat_id")
-        profile: Profile = get_object_or_404(Profile, chat_id=chat_id)
-        if self.get_created_orders_by_profile(profile=profile):
-            raise ValidationError(detail="Please pay for the last order.")
+        chat: ChatContext = chat_resolver.resolve(chat_id)
+        return create_open_order(user_id=chat.user_id)
+
+
+class OrderLineSerializer(ModelSerializer):
+    name = CharField(source="product.name", read_only=True)
+    price = DecimalField(
+        source="product.effective_price",
+        max_digits=15,
+        decimal_places=2,
+        read_only=True,
+    )
 
-        order: Orders = Orders.objects.create(
-            user=profile.user, status=OrderStatusChoices.CREATED
+    class Meta:
+        fields = ["product", "name", "price", "count"]
+        model = ProductToOrder
+
+
+class OrderHistorySerializer(ModelSerializer):
+    products = OrderLineSerializer(many=True, read_only=True)
+    payment = PaymentSerializer(read_only=True, many=False)
+
+    class Meta:
+        fields = ["uuid", "status", "created_timestamp", "total", "products", "payment"]
+        model = Orders
+
+
+class CartLineSerializer(Serializer):
+    product_id = UUIDField()
+    count = IntegerField(min_value=0)
+
+
+class CartUpdateSerializer(Serializer):
+    """
+    Пакетное изменение корзины (CREATED заказа): count — новое количество,
+    0 удаляет товар. Все строки применяются в одной транзакции:
+    INSERT ... ON CONFLICT (product, order) DO UPDATE + один DELETE
+    + один UPDATE Orders.total.
+    """
+
+    chat_id = CharField()
+    products = CartLineSerializer(many=True, allow_empty=False)
+
+    def validate_chat_id(self, value: str) -> str:
+        chat: ChatContext = chat_resolver.resolve_order(value)
+        if chat is None:
+            raise ValidationError(detail="Invalid chat_id.")
+        if chat.order_id is None:
+            raise NotFound("No CREATED order for this chat_id.")
+        return value
+
+    def validate_products(self, lines: List[dict]) -> List[dict]:
+        product_ids = [line["product_id"] for line in lines]
+        if len(set(product_ids)) != len(product_ids):
+            raise ValidationError(detail="Duplicate product_id.")
+        existing = set(
+            Products.objects.filter(uuid__in=product_ids).values_list("uuid", flat=True)
         )
-        return order
+        unknown = [str(pk) for pk in product_ids if pk not in existing]
+        if unknown:
+            raise ValidationError(detail=f"Unknown products: {', '.join(unknown)}")
+        return lines
+
+    def create(self, validated_data: dict) -> QuerySet[ProductToOrder]:
+        order_id = chat_resolver.resolve(validated_data["chat_id"]).order_id
+        lines = validated_data["products"]
+        with transaction.atomic():
+            # Блокировка заказа: оплата не пройдёт посреди изменения корзины,
+            # а устаревший order_id из кеша заменяется открытым заказом из БД
+            order_id = lock_open_order(validated_data["chat_id"], order_id)
+            ProductToOrder.objects.bulk_create(
+                [
+                    ProductToOrder(
+                        order_id=order_id,
+                        product_id=line["product_id"],
+                        count=line["count"],
+                    )
+                    for line in lines
+                    if line["count"] > 0
+                ],
+                update_conflicts=True,
+                unique_fields=["product", "order"],
+                update_fields=["count"],
+            )
+            ProductToOrder.objects.filter(
+                order_id=order_id,
+                product_id__in=[
+                    line["product_id"] for line in lines if line["count"] == 0
+                ],
+            ).delete()
+            # Приращения по строкам после ON CONFLICT не известны -> пересчёт
+            Orders.objects.filter(pk=order_id).recompute_totals()
+        return ProductToOrder.objects.filter(order_id=order_id).order_by("pk")
 
 
 class CreateOrderRequestSerializer(Serializer):
@@ -1,6 +1,13 @@
 from django.dispatch import receiver
-from django.db.models.signals import post_save
-from .models import Orders, Payment
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from .models import Orders, Payment, Products, Tags, ProductImage
+from .choices import OrderStatusChoices
+from django.db import transaction
+from .cache import bump_catalog_version_on_commit
+from .images import schedule_variants, variants_are_actual, delete_variant_files
+from .snapshots import mark_snapshot_dirty
+from .resolvers import chat_resolver
+from paper4auth.models import Profile
 
 
 @receiver(post_save, sender=Orders)
@@ -12,3 +19,136 @@ def create_payment_for_orders(
     """
     if created:
         Payment.objects.create(order=instance, name=f"Заказ {instance.user.username}", description="Оплата вашего заказа")
+
+
+@receiver(post_save, sender=Orders)
+@receiver(post_delete, sender=Orders)
+def invalidate_chat_resolver_on_order_change(sender, instance: Orders, **kwargs):
+    """
+    Создание/удаление заказа и смена статуса меняют открытый заказ пользователя
+    """
+    user_id = instance.user_id
+    transaction.on_commit(lambda: chat_resolver.invalidate_user(user_id))
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_chat_resolver_on_profile_change(sender, instance: Profile, **kwargs):
+    chat_id, user_id = instance.chat_id, instance.user_id
+
+    def invalidate():
+        # сначала по user_id: прежний chat_id, если он менялся
+        chat_resolver.invalidate_user(user_id)
+        chat_resolver.invalidate(chat_id)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Products)
+@receiver(post_delete, sender=Products)
+@receiver(post_save, sender=Tags)
+@receiver(post_delete, sender=Tags)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_catalog_cache(sender, **kwargs):
+    """
+    Любое изменение каталога меняет его версию -> старые ответы из кеша не используются
+    """
+    bump_catalog_version_on_commit()
+
+
+@receiver(m2m_changed, sender=Products.tags.through)
+def invalidate_catalog_cache_on_tags_change(sender, action: str, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_catalog_version_on_commit()
+
+
+@receiver(post_save, sender=ProductImage)
+def create_product_image_variants(sender, instance: ProductImage, **kwargs):
+    """
+    Новый или заменённый файл -> генерация вариантов в фоне после коммита
+    """
+    if instance.file and not variants_are_actual(instance):
+        transaction.on_commit(lambda: schedule_variants(instance))
+
+
+@receiver(post_delete, sender=ProductImage)
+def delete_product_image_variants(sender, instance: ProductImage, **kwargs):
+    variants = instance.variants
+    transaction.on_commit(lambda: delete_variant_files(variants))
+
+
+@receiver(post_save, sender=Products)
+def mark_product_snapshot_dirty(sender, instance: Products, **kwargs):
+    mark_snapshot_dirty(product_ids=[instance.pk])
+
+
+@receiver(pre_delete, sender=Products)
+def mark_deleted_product_snapshot_dirty(sender, instance: Products, **kwargs):
+    """
+    Связи с тегами удаляются каскадом без сигналов -> теги помечаем заранее
+    """
+    mark_snapshot_dirty(tag_ids=instance.tags.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Tags)
+def mark_tag_snapshot_dirty(sender, instance: Tags, **kwargs):
+    mark_snapshot_dirty(tag_ids=[instance.pk])
+
+
+@receiver(pre_delete, sender=Tags)
+def mark_deleted_tag_snapshot_dirty(sender, instance: Tags, **kwargs):
+    mark_snapshot_dirty(product_ids=instance.products.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def mark_product_image_snapshot_dirty(sender, instance: ProductImage, **kwargs):
+    mark_snapshot_dirty(product_ids=[instance.product_id])
+
+
+@receiver(m2m_changed, sender=Products.tags.through)
+def mark_tags_change_snapshot_dirty(sender, instance, action: str, reverse: bool, pk_set, **kwargs):
+    """
+    reverse=False: instance — товар, pk_set — теги; reverse=True — наоборот
+    """
+    if action in ("post_add", "post_remove"):
+        related = pk_set or ()
+    elif action == "pre_clear":
+        related = (instance.products if reverse else instance.tags).values_list("pk", flat=True)
+    else:
+        return
+    if reverse:
+        mark_snapshot_dirty(product_ids=related, tag_ids=[instance.pk])
+    else:
+        mark_snapshot_dirty(product_ids=[instance.pk], tag_ids=related)
+
+
+@receiver(post_save, sender=Products)
+def recompute_order_totals_on_price_change(sender, instance: Products, created: bool, **kwargs):
+    """
+    Orders.total считается по effective_price -> новая цена меняет суммы
+    открытых заказов. Оплаченные и завершённые заказы хранят сумму,
+    по которой прошла оплата (её сверяет reconcile_payments)
+    """
+    pricing = instance.get_pricing()
+    if not created and getattr(instance, "saved_pricing", None) != pricing:
+        Orders.objects.filter(
+            status=OrderStatusChoices.CREATED, products__product=instance
+        ).recompute_totals()
+    instance.saved_pricing = pricing
+
+
+@receiver(pre_delete, sender=Products)
+def remember_orders_of_deleted_product(sender, instance: Products, **kwargs):
+    # Строки заказов удаляются каскадом, без ProductToOrder.delete()
+    instance.affected_order_ids = list(
+        instance.orders.filter(order__status=OrderStatusChoices.CREATED).values_list("order_id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Products)
+def recompute_order_totals_on_product_delete(sender, instance: Products, **kwargs):
+    order_ids = getattr(instance, "affected_order_ids", [])
+    if order_ids:
+        Orders.objects.filter(pk__in=order_ids).recompute_totals()
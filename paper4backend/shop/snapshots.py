@@ -0,0 +1,189 @@
+import gzip
+import tempfile
+from itertools import islice
+from typing import Iterable, Optional, Set
+from uuid import UUID
+
+import orjson
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import QuerySet
+
+from .fast_serializers import ProductFastSerializer
+from .models import CatalogSnapshot, CatalogSnapshotDirtyShard, Products, Tags
+from .serializers import ProductSerializer
+
+CATALOG_SNAPSHOTS_PATH = "catalog/snapshots"
+PRODUCT_KEY_PREFIX = "product:"
+TAG_KEY_PREFIX = "tag:"
+
+
+def mark_snapshot_dirty(product_ids: Iterable = (), tag_ids: Iterable = ()) -> None:
+    """
+    Помечает товары/теги изменёнными: следующая сборка snapshot'а пересоберёт
+    шарды их тегов. Вызывать внутри транзакции изменения каталога.
+    """
+    keys = {f"{PRODUCT_KEY_PREFIX}{pk}" for pk in product_ids if pk is not None}
+    keys.update(f"{TAG_KEY_PREFIX}{pk}" for pk in tag_ids if pk is not None)
+    if keys:
+        CatalogSnapshotDirtyShard.objects.bulk_create(
+            [CatalogSnapshotDirtyShard(key=key) for key in keys],
+            ignore_conflicts=True,
+        )
+
+
+def get_current_snapshot() -> Optional[CatalogSnapshot]:
+    return CatalogSnapshot.objects.filter(is_ready=True).order_by("-version").first()
+
+
+class CatalogSnapshotBuilder:
+    """
+    Собирает snapshot каталога в default_storage:
+
+        catalog/snapshots/<version>/catalog.json.gz      — все активные товары
+        catalog/snapshots/<version>/tags/<uuid>.json.gz  — товары одного тега
+
+    Файл каталога пишется каждый раз, шарды — только для тегов, которых
+    касаются помеченные изменения (тег товара, сам тег или соседние теги
+    его товаров, т.к. имя тега лежит внутри товара). Остальные шарды
+    переиспользуются из прошлой версии.
+
+    Товары идут в формате ProductSerializer, сериализация пачками через
+    ProductFastSerializer, а gzip пишется во временный файл, поэтому память
+    не растёт с размером каталога.
+    """
+
+    def __init__(self, chunk_size: int = 1000):
+        self.chunk_size = chunk_size
+        self.serializer = ProductFastSerializer(fields=ProductSerializer.Meta.fields)
+        # Сколько шардов переписала последняя сборка
+        self.rebuilt_shards = 0
+
+    def claim_dirty_keys(self) -> Set[str]:
+        """
+        Забирает пометки. Пока строки под FOR UPDATE, параллельная пометка
+        того же ключа ждёт коммита и вставляет новую строку -> не теряется.
+        """
+        with transaction.atomic():
+            keys = set(
+                CatalogSnapshotDirtyShard.objects.select_for_update().values_list(
+                    "key", flat=True
+                )
+            )
+            CatalogSnapshotDirtyShard.objects.filter(key__in=keys).delete()
+        return keys
+
+    def get_affected_tags(self, keys: Set[str]) -> Set[UUID]:
+        through = Products.tags.through
+        product_ids = {
+            UUID(key.removeprefix(PRODUCT_KEY_PREFIX))
+            for key in keys
+            if key.startswith(PRODUCT_KEY_PREFIX)
+        }
+        tag_ids = {
+            UUID(key.removeprefix(TAG_KEY_PREFIX))
+            for key in keys
+            if key.startswith(TAG_KEY_PREFIX)
+        }
+        product_ids.update(
+            through.objects.filter(tags_id__in=tag_ids).values_list(
+                "products_id", flat=True
+            )
+        )
+        tag_ids.update(
+            through.objects.filter(products_id__in=product_ids).values_list(
+                "tags_id", flat=True
+            )
+        )
+        return tag_ids
+
+    def write(self, name: str, queryset: QuerySet, version: int) -> str:
+        with tempfile.TemporaryFile() as buffer:
+            with gzip.GzipFile(fileobj=buffer, mode="wb", mtime=0) as file:
+                file.write(b'{"version":%d,"products":[' % version)
+                rows = self.serializer.values(queryset).iterator(
+                    chunk_size=self.chunk_size
+                )
+                separator = b""
+                while chunk := list(islice(rows, self.chunk_size)):
+                    for item in self.serializer.serialize(chunk):
+                        file.write(separator + orjson.dumps(item, default=str))
+                        separator = b","
+                file.write(b"]}")
+            buffer.seek(0)
+            return default_storage.save(name, File(buffer))
+
+    def build(self, full: bool = False) -> Optional[CatalogSnapshot]:
+        """
+        None — изменений с прошлого snapshot'а не было
+        """
+        previous = get_current_snapshot()
+        keys = self.claim_dirty_keys()
+        if previous is not None and not keys and not full:
+            return None
+
+        snapshot = CatalogSnapshot.objects.create()
+        try:
+            self.build_files(snapshot, previous=None if full else previous, keys=keys)
+        except Exception:
+            snapshot.delete()
+            CatalogSnapshotDirtyShard.objects.bulk_create(
+                [CatalogSnapshotDirtyShard(key=key) for key in keys],
+                ignore_conflicts=True,
+            )
+            raise
+        return snapshot
+
+    def build_files(
+        self,
+        snapshot: CatalogSnapshot,
+        previous: Optional[CatalogSnapshot],
+        keys: Set[str],
+    ) -> None:
+        path = f"{CATALOG_SNAPSHOTS_PATH}/{snapshot.version}"
+        active = Products.objects.filter(is_archive=False).order_by("name", "uuid")
+        affected = self.get_affected_tags(keys) if previous is not None else set()
+
+        shards = {}
+        self.rebuilt_shards = 0
+        for tag_id, slag in Tags.objects.values_list("uuid", "slag"):
+            old = previous.shards.get(str(tag_id)) if previous is not None else None
+            if old is None or tag_id in affected:
+                file = self.write(
+                    name=f"{path}/tags/{tag_id}.json.gz",
+                    queryset=active.filter(tags=tag_id),
+                    version=snapshot.version,
+                )
+                self.rebuilt_shards += 1
+            else:
+                file = old["file"]
+            shards[str(tag_id)] = {"slag": slag, "file": file}
+
+        snapshot.catalog_file = self.write(
+            name=f"{path}/catalog.json.gz", queryset=active, version=snapshot.version
+        )
+        snapshot.shards = shards
+        snapshot.is_ready = True
+        snapshot.save(update_fields=["catalog_file", "shards", "is_ready"])
+
+
+def prune_snapshots(keep: int) -> int:
+    """
+    Удаляет версии старше keep последних и их файлы, на которые не ссылаются
+    оставшиеся версии. Возвращает число удалённых версий.
+    """
+    snapshots = list(CatalogSnapshot.objects.filter(is_ready=True).order_by("-version"))
+    kept, stale = snapshots[:keep], snapshots[keep:]
+    used = {snapshot.catalog_file for snapshot in kept}
+    used.update(
+        shard["file"] for snapshot in kept for shard in snapshot.shards.values()
+    )
+    files = {snapshot.catalog_file for snapshot in stale}
+    files.update(
+        shard["file"] for snapshot in stale for shard in snapshot.shards.values()
+    )
+    for file in files - used:
+        default_storage.delete(file)
+    CatalogSnapshot.objects.filter(version__in=[s.version for s in stale]).delete()
+    return len(stale)
@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .choices import OrderStatusChoices
+from .models import Orders
+from .resolvers import chat_resolver
+
+
+class AbandonedOrdersSweeper:
+    """
+    CREATED заказы старше ttl секунд переводятся в CANCELLED или удаляются
+    вместе со строками и Payment.
+
+    Работает пачками по chunk_size в отдельных транзакциях, строки берутся
+    через SELECT ... FOR UPDATE SKIP LOCKED: заказ, который сейчас меняет
+    запрос пользователя, пропускается до следующего прохода, а блокировки
+    держатся только на время одной пачки.
+    """
+
+    def __init__(self, ttl: int, chunk_size: int = 500, delete: bool = False):
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self.delete = delete
+
+    def get_queryset(self):
+        expired_before = timezone.now() - timedelta(seconds=self.ttl)
+        return Orders.objects.filter(
+            status=OrderStatusChoices.CREATED, created_timestamp__lt=expired_before
+        ).order_by("created_timestamp")
+
+    def sweep_chunk(self) -> int:
+        """
+        Обрабатывает одну пачку, возвращает число заказов
+        """
+        with transaction.atomic():
+            rows = list(
+                self.get_queryset()
+                .select_for_update(skip_locked=True)
+                .values_list("uuid", "user_id")[: self.chunk_size]
+            )
+            if not rows:
+                return 0
+            order_ids = [uuid for uuid, _ in rows]
+
+            orders = Orders.objects.filter(uuid__in=order_ids)
+            if self.delete:
+                # Payment и ProductToOrder удаляются каскадом, кеш chat_resolver
+                # сбрасывает post_delete заказа
+                orders.delete()
+            else:
+                # update() сигналов не шлёт — сбрасываем кеш открытых заказов сами
+                orders.update(status=OrderStatusChoices.CANCELLED)
+                user_ids = {user_id for _, user_id in rows}
+                transaction.on_commit(lambda: chat_resolver.invalidate_users(user_ids))
+        return len(rows)
+
+    def sweep(self, max_chunks: int = 0):
+        """
+        Генератор: после каждой пачки отдаёт число обработанных в ней заказов.
+        max_chunks=0 — пока есть что обрабатывать.
+        """
+        chunks = 0
+        while not max_chunks or chunks < max_chunks:
+            swept = self.sweep_chunk()
+            if not swept:
+                return
+            chunks += 1
+            yield swept
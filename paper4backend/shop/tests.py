@@ -1,3 +1,1300 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.cache import caches
+from django.conf import settings
+from django.db import connection
+from django.test import (
+    AsyncRequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from unittest import mock
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from paper4auth.models import Profile
+from rmq_handlers.utils import PaymentUtils
+from paper4backend.query_budget import QueryBudgetExceeded, query_budget
+from .archive import (
+    LINES_ARCHIVE_TABLE,
+    ORDERS_ARCHIVE_TABLE,
+    OrdersArchiver,
+    get_detached_partitions,
+    month_start,
+)
+from .cache import get_catalog_version
+from .catalog_import import CatalogImporter
+from .checks import check_catalog_cache
+from .choices import OrderStatusChoices, PaidStatusChoices
+from .images import IMAGE_VARIANT_SIZES, generate_variants
+from .models import (
+    Orders,
+    OrdersQuerySet,
+    Payment,
+    Products,
+    ProductImage,
+    ProductToOrder,
+    Tags,
+    tag_slug,
+)
+from .payments import apply_payment_status
+from .reconciliation import PaymentReconciler, read_rows
+from .resolvers import ChatContext, chat_resolver
+from .snapshots import CatalogSnapshotBuilder
+from .sweeper import AbandonedOrdersSweeper
+from .views import AsyncOrdersViewSet, ProductsReadOnlyViewSet
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class ShopTestCase(TestCase):
+    """
+    Пользователь с chat_id, теги и товары; бюджеты запросов (@query_budget)
+    проверяются строго
+    """
+
+    chat_id = "100500"
+
+    def setUp(self):
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        chat_resolver.clear()
+        self.user = User.objects.create(username="buyer")
+        Profile.objects.create(user=self.user, chat_id=self.chat_id)
+        self.tags = [Tags.objects.create(name=f"tag {i}") for i in range(3)]
+
+    def create_products(self, count: int) -> list:
+        products = []
+        for i in range(count):
+            product = Products.objects.create(name=f"product {i}", price=100, sale=5)
+            product.tags.set(self.tags)
+            ProductImage.objects.create(product=product, file=f"product/images/{i}.jpg")
+            products.append(product)
+        return products
+
+
+class QueryBudgetTestCase(ShopTestCase):
+    """
+    Все action с @query_budget падают с QueryBudgetExceeded, если превысят бюджет
+    """
+
+    def test_products_list_query_count_does_not_depend_on_size(self):
+        self.create_products(count=2)
+        with self.assertNumQueries(3):
+            self.client.get(reverse("shop:products_list"))
+
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        self.create_products(count=10)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("shop:products_list"))
+        self.assertEqual(len(response.json()), 12)
+
+    def test_orders_actions_within_budget(self):
+        products = self.create_products(count=3)
+        url = reverse("shop:orders_list")
+
+        # on_commit сбрасывает кеш chat_resolver
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                url, {"chat_id": self.chat_id}, content_type="application/json"
+            )
+        self.assertEqual(response.status_code, 200)
+
+        for product in products:
+            response = self.client.patch(
+                url,
+                {"chat_id": self.chat_id, "product_id": str(product.uuid), "count": 2},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(url, {"chat_id": self.chat_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["products"]), 3)
+        # 3 товара * 2 шт * (100 - 5%)
+        self.assertEqual(response.json()["payment"]["amount"], 570.0)
+
+        response = self.client.delete(
+            f"{url}?chat_id={self.chat_id}&product_id={products[0].uuid}"
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(ProductToOrder.objects.count(), 2)
+        self.assertEqual(Orders.objects.get().total, Decimal("380.00"))
+
+    def test_budget_exceeded_raises(self):
+        class View:
+            @query_budget(1)
+            def list(self, request):
+                return list(Orders.objects.all()) + list(Products.objects.all())
+
+        with self.assertRaises(QueryBudgetExceeded):
+            View().list(request=None)
+
+
+class SparseFieldsTestCase(ShopTestCase):
+    def test_sparse_fields_skip_unused_relations(self):
+        self.create_products(count=3)
+        url = reverse("shop:products_list")
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {"fields": "name,price"})
+        self.assertEqual(list(response.json()[0]), ["name", "price"])
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {"view": "card"})
+        self.assertEqual(list(response.json()[0]), ["name", "price", "image"])
+
+
+class FastSerializerTestCase(ShopTestCase):
+    def test_fast_serializer_matches_product_serializer(self):
+        self.create_products(count=5)
+        url = reverse("shop:products_list")
+        for params in [{}, {"page_size": 2, "ordering": "-price"}, {"omit": "tags"}]:
+            caches[settings.CATALOG_CACHE_ALIAS].clear()
+            fast = self.client.get(url, params).json()
+            caches[settings.CATALOG_CACHE_ALIAS].clear()
+            with mock.patch.object(
+                ProductsReadOnlyViewSet, "use_fast_serializer", False
+            ):
+                slow = self.client.get(url, params).json()
+            self.assertEqual(fast, slow)
+
+
+class OpenOrderConstraintTestCase(ShopTestCase):
+    def test_second_created_order_is_rejected(self):
+        url = reverse("shop:orders_list")
+        data = {"chat_id": self.chat_id}
+        response = self.client.post(url, data, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(url, data, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            Orders.objects.filter(status=OrderStatusChoices.CREATED).count(), 1
+        )
+
+
+class CartUpdateTestCase(ShopTestCase):
+    def test_cart_batch_update_upserts_and_removes(self):
+        products = self.create_products(count=3)
+        order = Orders.objects.create(user=self.user)
+        ProductToOrder.objects.create(order=order, product=products[0], count=1)
+        ProductToOrder.objects.create(order=order, product=products[1], count=1)
+
+        response = self.client.patch(
+            reverse("shop:orders_products"),
+            {
+                "chat_id": self.chat_id,
+                "products": [
+                    {"product_id": str(products[0].uuid), "count": 5},
+                    {"product_id": str(products[1].uuid), "count": 0},
+                    {"product_id": str(products[2].uuid), "count": 2},
+                ],
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(order.products.values_list("product_id", "count")),
+            {products[0].uuid: 5, products[2].uuid: 2},
+        )
+        order.refresh_from_db()
+        self.assertEqual(order.total, Decimal("665.00"))
+
+        response = self.client.patch(
+            reverse("shop:orders_products"),
+            {
+                "chat_id": self.chat_id,
+                "products": [{"product_id": str(Tags.objects.first().pk), "count": 1}],
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_chat_id_is_required(self):
+        (product,) = self.create_products(count=1)
+        order = Orders.objects.create(user=self.user)
+        response = self.client.patch(
+            reverse("shop:orders_products"),
+            {"products": [{"product_id": str(product.uuid), "count": 1}]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("chat_id", response.json())
+        self.assertFalse(ProductToOrder.objects.filter(order=order).exists())
+
+
+class OrderHistoryTestCase(ShopTestCase):
+    def test_order_history_is_paginated_with_fixed_queries(self):
+        products = self.create_products(count=2)
+        for status in [OrderStatusChoices.PAID] * 4 + [OrderStatusChoices.CREATED]:
+            order = Orders.objects.create(user=self.user, status=status)
+            for product in products:
+                ProductToOrder.objects.create(order=order, product=product, count=1)
+        url = reverse("shop:orders_history")
+
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {"chat_id": self.chat_id, "page_size": 3})
+        page = response.json()
+        self.assertEqual(len(page["results"]), 3)
+        self.assertEqual(page["results"][0]["status"], OrderStatusChoices.CREATED)
+        self.assertEqual(page["results"][0]["total"], "190.00")
+
+        response = self.client.get(page["next"])
+        self.assertEqual(len(response.json()["results"]), 2)
+
+        response = self.client.get(
+            url, {"chat_id": self.chat_id, "status": OrderStatusChoices.CREATED}
+        )
+        self.assertEqual(len(response.json()["results"]), 1)
+
+
+class IdempotencyTestCase(ShopTestCase):
+    def test_idempotency_key_replays_stored_response(self):
+        url = reverse("shop:orders_list")
+        data = {"chat_id": self.chat_id}
+        headers = {"Idempotency-Key": "create-1"}
+        first = self.client.post(
+            url, data, content_type="application/json", headers=headers
+        )
+        self.assertEqual(first.status_code, 200)
+
+        # lock + select + unlock, без запросов самого create
+        with self.assertNumQueries(3):
+            replay = self.client.post(
+                url, data, content_type="application/json", headers=headers
+            )
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+        self.assertEqual(Orders.objects.count(), 1)
+
+        response = self.client.post(
+            url,
+            {"chat_id": self.chat_id, "sender_service": "bot"},
+            content_type="application/json",
+            headers=headers,
+        )
+        self.assertEqual(response.status_code, 422)
+
+    def test_idempotency_key_is_scoped_to_chat_id(self):
+        other = User.objects.create(username="other buyer")
+        Profile.objects.create(user=other, chat_id="200600")
+        url = reverse("shop:orders_list")
+        headers = {"Idempotency-Key": "create-1"}
+        for chat_id in (self.chat_id, "200600"):
+            response = self.client.post(
+                url,
+                {"chat_id": chat_id},
+                content_type="application/json",
+                headers=headers,
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("Idempotent-Replayed", response)
+        self.assertEqual(
+            set(Orders.objects.values_list("user_id", flat=True)),
+            {self.user.pk, other.pk},
+        )
+
+
+class ProductPaginationTestCase(TestCase):
+    def setUp(self):
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        # 5 товаров с одинаковой ценой: порядок внутри держит uuid
+        for i in range(7):
+            Products.objects.create(name=f"product {i}", price=10 if i < 5 else 20)
+        self.url = reverse("shop:products_list")
+
+    def names(self, page: dict) -> list:
+        return [product["name"] for product in page["results"]]
+
+    def test_cursor_walks_forward_and_back_through_ties(self):
+        expected = list(
+            Products.objects.order_by("price", "uuid").values_list("name", flat=True)
+        )
+        page = self.client.get(self.url, {"ordering": "price", "page_size": 3}).json()
+        self.assertIsNone(page["previous"])
+        pages = [self.names(page)]
+        while page["next"]:
+            page = self.client.get(page["next"]).json()
+            pages.append(self.names(page))
+        self.assertEqual([len(names) for names in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+        for names in reversed(pages[:-1]):
+            page = self.client.get(page["previous"]).json()
+            self.assertEqual(self.names(page), names)
+        self.assertIsNone(page["previous"])
+        self.assertIsNotNone(page["next"])
+
+    def test_cursor_of_other_ordering_is_rejected(self):
+        page = self.client.get(self.url, {"ordering": "price", "page_size": 3}).json()
+        cursor = page["next"].split("cursor=")[1].split("&")[0]
+        response = self.client.get(
+            self.url, {"ordering": "name", "page_size": 3, "cursor": cursor}
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class ProductListCacheTestCase(TestCase):
+    def setUp(self):
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        self.tag = Tags.objects.create(name="pens")
+        self.product = Products.objects.create(name="pen", price=10)
+        self.url = reverse("shop:products_list")
+
+    def test_if_none_match_returns_304_without_queries(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                self.url, headers={"If-None-Match": first["ETag"]}
+            )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], first["ETag"])
+
+        # Другие параметры — другой ключ и ETag
+        response = self.client.get(
+            self.url, {"ordering": "-price"}, headers={"If-None-Match": first["ETag"]}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_product_save_bumps_version_and_serves_fresh_list(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).json(), first.json())
+
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 20
+            self.product.save()
+        self.assertEqual(get_catalog_version(), version + 1)
+
+        response = self.client.get(self.url, headers={"If-None-Match": first["ETag"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], first["ETag"])
+        self.assertEqual(response.json()[0]["price"], "20.00")
+
+    def test_version_bump_from_another_process_drops_etag(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        backend = "django.core.cache.backends.filebased.FileBasedCache"
+        shared = {**settings.CACHES}
+        shared[settings.CATALOG_CACHE_ALIAS] = {
+            "BACKEND": backend,
+            "LOCATION": location,
+        }
+
+        with override_settings(CACHES=shared):
+            first = self.client.get(self.url)
+            response = self.client.get(
+                self.url, headers={"If-None-Match": first["ETag"]}
+            )
+            self.assertEqual(response.status_code, 304)
+
+            # Как manage.py import_catalog или соседний воркер
+            subprocess.run(
+                [
+                    sys.executable,
+                    "manage.py",
+                    "shell",
+                    "-c",
+                    "from shop.cache import bump_catalog_version; "
+                    "bump_catalog_version()",
+                ],
+                cwd=settings.BASE_DIR,
+                env={
+                    **os.environ,
+                    "CATALOG_CACHE_BACKEND": backend,
+                    "CATALOG_CACHE_LOCATION": location,
+                },
+                check=True,
+                capture_output=True,
+            )
+
+            response = self.client.get(
+                self.url, headers={"If-None-Match": first["ETag"]}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["ETag"], first["ETag"])
+
+    def test_process_local_cache_refused(self):
+        local = {**settings.CACHES}
+        local[settings.CATALOG_CACHE_ALIAS] = {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+        }
+        with override_settings(CACHES=local, CATALOG_CACHE_SINGLE_PROCESS=False):
+            self.assertEqual(
+                [error.id for error in check_catalog_cache(None)], ["shop.E001"]
+            )
+        with override_settings(CACHES=local, CATALOG_CACHE_SINGLE_PROCESS=True):
+            self.assertEqual(check_catalog_cache(None), [])
+
+    def test_catalog_changes_bump_version(self):
+        def change_tag_name():
+            self.tag.name = "ручки"
+            self.tag.save()
+
+        changes = [
+            lambda: Tags.objects.create(name="books"),
+            change_tag_name,
+            lambda: self.product.tags.add(self.tag),
+            self.tag.delete,
+            self.product.delete,
+        ]
+        for change in changes:
+            version = get_catalog_version()
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertGreater(get_catalog_version(), version)
+
+
+class ProductTagFilterTestCase(TestCase):
+    def setUp(self):
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        pens = Tags.objects.create(name="Ручки")
+        notebooks = Tags.objects.create(name="Тетради в клетку")
+        office = Tags.objects.create(name="office")
+        self.slugs = [pens.slag, notebooks.slag, office.slag]
+        for name, tags in [
+            ("pen", [pens]),
+            ("pen set", [pens, notebooks]),
+            ("notebook", [notebooks, office]),
+            ("stapler", []),
+        ]:
+            Products.objects.create(name=name, price=1).tags.set(tags)
+
+    def names(self, **params) -> list:
+        response = self.client.get(reverse("shop:products_list"), params)
+        self.assertEqual(response.status_code, 200)
+        return [product["name"] for product in response.json()]
+
+    def test_any_and_all_tags(self):
+        pens, notebooks, office = self.slugs
+        self.assertEqual(pens, "ручки")
+        self.assertEqual(
+            self.names(tags=f"{pens},{notebooks}"), ["notebook", "pen", "pen set"]
+        )
+        self.assertEqual(
+            self.names(tags=f"{pens},{notebooks}", tags_match="any"),
+            ["notebook", "pen", "pen set"],
+        )
+        self.assertEqual(
+            self.names(tags=f"{pens},{notebooks}", tags_match="all"), ["pen set"]
+        )
+        self.assertEqual(
+            self.names(tags=f"{notebooks},{office}", tags_match="all"), ["notebook"]
+        )
+        self.assertEqual(self.names(tags=f"{pens},{office}", tags_match="all"), [])
+        self.assertEqual(self.names(tags=f"{pens},unknown"), ["pen", "pen set"])
+        self.assertEqual(self.names(tags=f"{pens},unknown", tags_match="all"), [])
+
+    def test_tag_search(self):
+        self.assertEqual(self.names(tag_search="Ручки"), ["pen", "pen set"])
+        self.assertEqual(self.names(tag_search="office"), ["notebook"])
+        self.assertEqual(self.names(tag_search="Ручки", tags=self.slugs[2]), [])
+
+
+class ProductSearchTestCase(TestCase):
+    def setUp(self):
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        # Совпадение в name (вес A) важнее, чем в description (вес B)
+        for name, description, price in [
+            ("Ручка синяя", "Шариковая ручка", 30),
+            ("Ручка гелевая", None, 20),
+            ("Тетрадь", "Удобно писать любой ручкой", 10),
+            ("Степлер", "Скобы в комплекте", 40),
+        ]:
+            Products.objects.create(name=name, description=description, price=price)
+        self.url = reverse("shop:products_list")
+
+    def names(self, results: list) -> list:
+        return [product["name"] for product in results]
+
+    def test_results_are_ordered_by_rank(self):
+        response = self.client.get(self.url, {"q": "ручки"})
+        self.assertEqual(
+            self.names(response.json()), ["Ручка синяя", "Ручка гелевая", "Тетрадь"]
+        )
+        response = self.client.get(self.url, {"q": "ручки", "ordering": "price"})
+        self.assertEqual(
+            self.names(response.json()), ["Тетрадь", "Ручка гелевая", "Ручка синяя"]
+        )
+
+    def test_search_with_keyset_pagination(self):
+        for params, expected in [
+            ({"q": "ручка"}, ["Ручка синяя", "Ручка гелевая", "Тетрадь"]),
+            (
+                {"q": "ручка", "ordering": "price"},
+                ["Тетрадь", "Ручка гелевая", "Ручка синяя"],
+            ),
+        ]:
+            page = self.client.get(self.url, {**params, "page_size": 1}).json()
+            names = self.names(page["results"])
+            while page["next"]:
+                page = self.client.get(page["next"]).json()
+                names += self.names(page["results"])
+            self.assertEqual(names, expected)
+
+            previous = self.client.get(page["previous"]).json()
+            self.assertEqual(self.names(previous["results"]), expected[-2:-1])
+
+
+class EffectivePriceTestCase(TestCase):
+    def setUp(self):
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        self.url = reverse("shop:products_list")
+
+    def test_generated_column_rounds_to_cents(self):
+        for price, sale, expected in [
+            ("9.99", 15, "8.49"),
+            ("10.05", 50, "5.03"),
+            ("100", 100, "0.00"),
+            ("19.99", 0, "19.99"),
+        ]:
+            product = Products.objects.create(name="pen", price=price, sale=sale)
+            product.refresh_from_db()
+            self.assertEqual(product.effective_price, Decimal(expected))
+
+        Products.objects.update(sale=10)
+        self.assertEqual(
+            sorted(Products.objects.values_list("effective_price", flat=True)),
+            [Decimal("8.99"), Decimal("9.05"), Decimal("17.99"), Decimal("90.00")],
+        )
+
+    def test_price_bounds_and_ordering_use_discounted_price(self):
+        Products.objects.create(name="discounted", price=100, sale=50)
+        Products.objects.create(name="regular", price=60)
+        Products.objects.create(name="cheap", price=40)
+
+        def names(**params) -> list:
+            return [p["name"] for p in self.client.get(self.url, params).json()]
+
+        self.assertEqual(names(min_price=50, max_price=60), ["discounted", "regular"])
+        self.assertEqual(names(max_price=50), ["cheap", "discounted"])
+        self.assertEqual(names(min_price="50.01"), ["regular"])
+        self.assertEqual(
+            names(ordering="effective_price"), ["cheap", "discounted", "regular"]
+        )
+        self.assertEqual(
+            names(ordering="-effective_price"), ["regular", "discounted", "cheap"]
+        )
+
+
+class OrderTotalsTestCase(TestCase):
+    def setUp(self):
+        self.product = Products.objects.create(name="pen", price=10)
+        self.open = Orders.objects.create(user=User.objects.create(username="a"))
+        self.paid = Orders.objects.create(user=User.objects.create(username="b"))
+        for order in (self.open, self.paid):
+            ProductToOrder.objects.create(order=order, product=self.product, count=1)
+        # Строки добавлены, пока заказ был открыт, затем оплачен
+        Orders.objects.filter(pk=self.paid.pk).update(status=OrderStatusChoices.PAID)
+
+    def totals(self) -> dict:
+        return dict(Orders.objects.values_list("uuid", "total"))
+
+    def test_price_change_recomputes_only_open_orders(self):
+        product = Products.objects.get()
+        product.price = 50
+        product.save()
+        totals = self.totals()
+        self.assertEqual(totals[self.open.uuid], Decimal("50.00"))
+        self.assertEqual(totals[self.paid.uuid], Decimal("10.00"))
+
+        product.name = "blue pen"
+        with mock.patch.object(OrdersQuerySet, "recompute_totals") as recompute:
+            product.save()
+            Products.objects.get().save()
+        recompute.assert_not_called()
+
+    def test_queryset_price_updates_recompute_only_open_orders(self):
+        Products.objects.filter(pk=self.product.pk).update(price=30)
+        totals = self.totals()
+        self.assertEqual(totals[self.open.uuid], Decimal("30.00"))
+        self.assertEqual(totals[self.paid.uuid], Decimal("10.00"))
+
+        self.product.price, self.product.sale = 40, 50
+        Products.objects.bulk_update([self.product], ["price", "sale"])
+        totals = self.totals()
+        self.assertEqual(totals[self.open.uuid], Decimal("20.00"))
+        self.assertEqual(totals[self.paid.uuid], Decimal("10.00"))
+
+        with mock.patch.object(OrdersQuerySet, "recompute_totals") as recompute:
+            Products.objects.filter(pk=self.product.pk).update(name="blue pen")
+            Products.objects.bulk_update([self.product], ["name"])
+        recompute.assert_not_called()
+
+    def test_paid_order_lines_do_not_change_total(self):
+        line = ProductToOrder.objects.get(order=self.paid)
+        line.count = 5
+        line.save()
+        ProductToOrder.objects.create(
+            order=self.paid,
+            product=Products.objects.create(name="pencil", price=3),
+            count=1,
+        )
+        line.delete()
+        self.paid.refresh_from_db()
+        self.assertEqual(self.paid.total, Decimal("10.00"))
+
+    def test_product_delete_keeps_paid_total(self):
+        self.product.delete()
+        totals = self.totals()
+        self.assertEqual(totals[self.open.uuid], Decimal("0.00"))
+        self.assertEqual(totals[self.paid.uuid], Decimal("10.00"))
+
+
+class OrderTotalsStressTestCase(TransactionTestCase):
+    def test_concurrent_line_updates_keep_total(self):
+        product = Products.objects.create(name="pen", price=10)
+        order = Orders.objects.create(user=User.objects.create(username="buyer"))
+        ProductToOrder.objects.create(order=order, product=product, count=1)
+        counts = [2, 3, 4, 5, 6, 7]
+        barrier = threading.Barrier(len(counts))
+
+        def update(count: int):
+            # Строка прочитана без блокировки, как в ProductToOrderSerializer
+            line = ProductToOrder.objects.get()
+            barrier.wait()
+            try:
+                line.count = count
+                line.save(update_fields=["count"])
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(counts)) as pool:
+            list(pool.map(update, counts))
+
+        order.refresh_from_db()
+        self.assertEqual(order.total, ProductToOrder.objects.get().count * 10)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class ChatResolverTestCase(TestCase):
+    chat_id = "100500"
+
+    def setUp(self):
+        chat_resolver.clear()
+        self.user = User.objects.create(username="buyer")
+        Profile.objects.create(user=self.user, chat_id=self.chat_id)
+
+    def test_resolves_once_until_orders_change(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(chat_resolver.resolve(self.chat_id).order_id)
+            self.assertEqual(chat_resolver.resolve(self.chat_id).user_id, self.user.pk)
+        self.assertIsNone(chat_resolver.resolve("unknown"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Orders.objects.create(user=self.user)
+        self.assertEqual(chat_resolver.resolve(self.chat_id).order_id, order.uuid)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = OrderStatusChoices.PAID
+            order.save()
+        self.assertIsNone(chat_resolver.resolve(self.chat_id).order_id)
+
+    def test_stale_open_order_is_not_modified(self):
+        product = Products.objects.create(name="pen", price=10)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Orders.objects.create(user=self.user)
+        self.assertEqual(chat_resolver.resolve(self.chat_id).order_id, order.uuid)
+        # Оплачен в другом процессе: update() без сигналов, кеш не сброшен
+        Orders.objects.filter(pk=order.pk).update(status=OrderStatusChoices.PAID)
+
+        response = self.client.patch(
+            reverse("shop:orders_list"),
+            {"chat_id": self.chat_id, "product_id": str(product.uuid), "count": 2},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(ProductToOrder.objects.exists())
+        order.refresh_from_db()
+        self.assertEqual(order.total, Decimal("0.00"))
+        self.assertIsNone(chat_resolver.resolve(self.chat_id).order_id)
+
+    def create_order_elsewhere(self) -> Orders:
+        # Как другой процесс: bulk_create без сигналов, кеш этого процесса не сброшен
+        (order,) = Orders.objects.bulk_create([Orders(user=self.user)])
+        Payment.objects.bulk_create([Payment(order=order)])
+        return order
+
+    def test_cached_missing_order_is_rechecked(self):
+        product = Products.objects.create(name="pen", price=10)
+        self.assertIsNone(chat_resolver.resolve(self.chat_id).order_id)
+        order = self.create_order_elsewhere()
+
+        response = self.client.patch(
+            reverse("shop:orders_list"),
+            {"chat_id": self.chat_id, "product_id": str(product.uuid), "count": 2},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(chat_resolver.resolve(self.chat_id).order_id, order.uuid)
+
+        chat_resolver.set_local(self.chat_id, ChatContext(self.user.pk, None))
+        response = self.client.patch(
+            reverse("shop:orders_products"),
+            {
+                "chat_id": self.chat_id,
+                "products": [{"product_id": str(product.uuid), "count": 3}],
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual(order.total, Decimal("30.00"))
+
+    def test_stale_open_order_is_replaced_by_current(self):
+        product = Products.objects.create(name="pen", price=10)
+        paid = self.create_order_elsewhere()
+        self.assertEqual(chat_resolver.resolve(self.chat_id).order_id, paid.uuid)
+        Orders.objects.filter(pk=paid.pk).update(status=OrderStatusChoices.PAID)
+        order = self.create_order_elsewhere()
+
+        response = self.client.patch(
+            reverse("shop:orders_list"),
+            {"chat_id": self.chat_id, "product_id": str(product.uuid), "count": 2},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(ProductToOrder.objects.values_list("order_id", flat=True)),
+            [order.uuid],
+        )
+
+        chat_resolver.set_local(self.chat_id, ChatContext(self.user.pk, paid.uuid))
+        transition = PaymentUtils.set_paid_status(
+            status=PaidStatusChoices.PAID, chat_id=self.chat_id
+        )
+        self.assertEqual(transition.order_id, order.uuid)
+        self.assertTrue(transition.applied)
+
+
+class AsyncOrdersViewSetTestCase(TestCase):
+    chat_id = "100500"
+
+    def setUp(self):
+        chat_resolver.clear()
+        self.user = User.objects.create(username="buyer")
+        Profile.objects.create(user=self.user, chat_id=self.chat_id)
+        self.product = Products.objects.create(name="pen", price=10)
+        self.view = AsyncOrdersViewSet.as_view(
+            {
+                "get": "retrieve",
+                "post": "create",
+                "patch": "update",
+                "delete": "destroy",
+            }
+        )
+        self.factory = AsyncRequestFactory()
+
+    async def test_cart_flow(self):
+        response = await self.view(
+            self.factory.post(
+                "/", {"chat_id": self.chat_id}, content_type="application/json"
+            )
+        )
+        self.assertEqual(response.status_code, 200)
+        order_id = response.data["uuid"]
+
+        # в TestCase on_commit не выполняется, кеш сбрасываем сами
+        chat_resolver.clear()
+        response = await self.view(
+            self.factory.patch(
+                "/",
+                {
+                    "chat_id": self.chat_id,
+                    "product_id": str(self.product.uuid),
+                    "count": 3,
+                },
+                content_type="application/json",
+            )
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = await self.view(self.factory.get("/", {"chat_id": self.chat_id}))
+        self.assertEqual(str(response.data["uuid"]), str(order_id))
+        self.assertEqual(len(response.data["products"]), 1)
+        self.assertEqual(response.data["payment"]["amount"], 30.0)
+
+        response = await self.view(
+            self.factory.delete(
+                f"/?chat_id={self.chat_id}&product_id={self.product.uuid}"
+            )
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(await ProductToOrder.objects.aexists())
+
+    async def test_stale_open_order_is_not_modified(self):
+        order = await Orders.objects.acreate(user=self.user)
+        self.assertEqual(
+            (await chat_resolver.aresolve(self.chat_id)).order_id, order.uuid
+        )
+        await Orders.objects.filter(pk=order.pk).aupdate(status=OrderStatusChoices.PAID)
+
+        response = await self.view(
+            self.factory.patch(
+                "/",
+                {
+                    "chat_id": self.chat_id,
+                    "product_id": str(self.product.uuid),
+                    "count": 3,
+                },
+                content_type="application/json",
+            )
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(await ProductToOrder.objects.aexists())
+        self.assertIsNone((await chat_resolver.aresolve(self.chat_id)).order_id)
+
+
+class AbandonedOrdersSweeperTestCase(TestCase):
+    def setUp(self):
+        chat_resolver.clear()
+        self.product = Products.objects.create(name="pen", price=10)
+        self.orders = []
+        for i in range(5):
+            user = User.objects.create(username=f"buyer {i}")
+            Profile.objects.create(user=user, chat_id=str(i))
+            order = Orders.objects.create(user=user)
+            ProductToOrder.objects.create(order=order, product=self.product, count=1)
+            self.orders.append(order)
+        # 3 старых заказа, 2 свежих
+        Orders.objects.filter(uuid__in=[o.uuid for o in self.orders[:3]]).update(
+            created_timestamp=timezone.now() - timedelta(days=30)
+        )
+
+    def test_cancels_expired_orders_in_chunks(self):
+        self.assertIsNotNone(chat_resolver.resolve("0").order_id)
+        sweeper = AbandonedOrdersSweeper(ttl=60 * 60 * 24, chunk_size=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(list(sweeper.sweep()), [2, 1])
+        self.assertEqual(
+            Orders.objects.filter(status=OrderStatusChoices.CANCELLED).count(), 3
+        )
+        self.assertEqual(
+            Orders.objects.filter(status=OrderStatusChoices.CREATED).count(), 2
+        )
+        self.assertIsNone(chat_resolver.resolve("0").order_id)
+
+    def test_delete_removes_lines_and_payments(self):
+        sweeper = AbandonedOrdersSweeper(ttl=60 * 60 * 24, delete=True)
+        self.assertEqual(sum(sweeper.sweep()), 3)
+        self.assertEqual(Orders.objects.count(), 2)
+        self.assertEqual(ProductToOrder.objects.count(), 2)
+        self.assertEqual(Payment.objects.count(), 2)
+
+
+class OrdersArchiveTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        user = User.objects.create(username="buyer")
+        product = Products.objects.create(name="pen", price=10)
+        self.old = Orders.objects.create(user=user)
+        ProductToOrder.objects.create(order=self.old, product=product, count=2)
+        Orders.objects.filter(uuid=self.old.uuid).update(
+            status=OrderStatusChoices.SUCCESS,
+            created_timestamp=timezone.now() - timedelta(days=400),
+        )
+        Orders.objects.create(user=user, status=OrderStatusChoices.SUCCESS)
+        Orders.objects.create(user=user)
+
+    def count(self, table: str) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {table}")
+            return cursor.fetchone()[0]
+
+    def test_old_orders_move_to_partitions_and_export(self):
+        before = month_start(timezone.now(), -6)
+        archiver = OrdersArchiver(before=before)
+        self.assertEqual(sum(archiver.archive()), 1)
+        self.assertFalse(Orders.objects.filter(uuid=self.old.uuid).exists())
+        self.assertEqual(Orders.objects.count(), 2)
+        self.assertEqual(Payment.objects.count(), 2)
+        self.assertEqual(self.count(ORDERS_ARCHIVE_TABLE), 1)
+        self.assertEqual(self.count(LINES_ARCHIVE_TABLE), 1)
+
+        self.assertEqual(len(archiver.detach(before)), 2)
+        self.assertEqual(self.count(ORDERS_ARCHIVE_TABLE), 0)
+        paths = [archiver.export(name) for name in get_detached_partitions()]
+        self.assertEqual(get_detached_partitions(), [])
+        with default_storage.open(paths[0]) as file:
+            rows = list(
+                csv.DictReader(io.StringIO(gzip.decompress(file.read()).decode()))
+            )
+        self.assertEqual(rows[0]["uuid"], str(self.old.uuid))
+        self.assertEqual(rows[0]["total"], "20.00")
+
+
+class PaymentTransitionTestCase(TestCase):
+    def setUp(self):
+        chat_resolver.clear()
+        self.user = User.objects.create(username="buyer")
+        Profile.objects.create(user=self.user, chat_id="100500")
+        self.order = Orders.objects.create(user=self.user)
+
+    def test_allowed_transitions_only(self):
+        failed = apply_payment_status([self.order.uuid], PaidStatusChoices.FAILED)
+        self.assertTrue(failed[self.order.uuid].applied)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, OrderStatusChoices.CREATED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = PaymentUtils.status_payment(
+                json.dumps(
+                    {
+                        "type": "payment.status",
+                        "chat_id": "100500",
+                        "correlation_id": "payment.status.1",
+                        "data": {"status": "PAID"},
+                    }
+                ).encode()
+            )
+        self.assertEqual(response.type, "payment.status.response")
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, OrderStatusChoices.PAID)
+        self.assertEqual(self.order.payment.status, PaidStatusChoices.PAID)
+        self.assertIsNone(chat_resolver.resolve("100500").order_id)
+
+        again = apply_payment_status([self.order.uuid], PaidStatusChoices.FAILED)
+        self.assertEqual(
+            again[self.order.uuid],
+            (
+                self.order.uuid,
+                False,
+                OrderStatusChoices.PAID,
+                PaidStatusChoices.PAID,
+            ),
+        )
+
+
+class PaymentReconcilerTestCase(TestCase):
+    def test_applies_transitions_and_reports_mismatches(self):
+        product = Products.objects.create(name="pen", price=10)
+        orders = []
+        for i in range(4):
+            user = User.objects.create(username=f"buyer {i}")
+            order = Orders.objects.create(user=user)
+            ProductToOrder.objects.create(order=order, product=product, count=1)
+            orders.append(order)
+        apply_payment_status([orders[3].uuid], PaidStatusChoices.PAID)
+
+        lines = [
+            {"order_id": str(orders[0].uuid), "amount": "10.00", "status": "PAID"},
+            {"order_id": str(orders[1].uuid), "amount": "10", "status": "failed"},
+            {"order_id": str(orders[2].uuid), "amount": "9.99", "status": "PAID"},
+            {"order_id": str(orders[3].uuid), "amount": "10", "status": "FAILED"},
+            {
+                "order_id": str(Tags.objects.create(name="x").uuid),
+                "amount": "1",
+                "status": "PAID",
+            },
+            {"order_id": "not-a-uuid", "amount": "1", "status": "PAID"},
+        ]
+        file = io.StringIO("\n".join(json.dumps(line) for line in lines) + "\nbad\n")
+        report = io.StringIO()
+        reconciler = PaymentReconciler(report=csv.writer(report), chunk_size=4)
+        self.assertEqual(list(reconciler.reconcile(read_rows(file, "jsonl"))), [4, 3])
+
+        self.assertEqual(reconciler.stats["applied"], 2)
+        statuses = dict(Orders.objects.values_list("uuid", "payment__status"))
+        self.assertEqual(statuses[orders[0].uuid], PaidStatusChoices.PAID)
+        self.assertEqual(statuses[orders[1].uuid], PaidStatusChoices.FAILED)
+        self.assertEqual(statuses[orders[2].uuid], PaidStatusChoices.CREATED)
+        kinds = Counter(
+            row["kind"] for row in csv.DictReader(io.StringIO(report.getvalue()))
+        )
+        self.assertEqual(
+            kinds,
+            {
+                "amount_mismatch": 1,
+                "status_conflict": 1,
+                "unknown_order": 1,
+                "invalid_row": 2,
+            },
+        )
+
+
+class PaymentTransitionStressTestCase(TransactionTestCase):
+    """
+    Параллельные сообщения о статусе одного заказа: каждое в своём потоке
+    и соединении с БД
+    """
+
+    def test_concurrent_messages_apply_paid_once(self):
+        user = User.objects.create(username="buyer")
+        order = Orders.objects.create(user=user)
+        statuses = [PaidStatusChoices.PAID, PaidStatusChoices.FAILED] * 8
+        barrier = threading.Barrier(len(statuses))
+
+        def send(status: str):
+            barrier.wait()
+            try:
+                return apply_payment_status([order.uuid], status)[order.uuid]
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(statuses)) as pool:
+            results = list(pool.map(send, statuses))
+
+        paid = [r for r in results if r.applied and r.payment_status == "PAID"]
+        self.assertEqual(len(paid), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.status, OrderStatusChoices.PAID)
+        self.assertEqual(order.payment.status, PaidStatusChoices.PAID)
+
+
+class CatalogSnapshotTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.books = Tags.objects.create(name="books")
+        self.pens = Tags.objects.create(name="pens")
+        self.book = Products.objects.create(name="book", price=100)
+        self.book.tags.add(self.books)
+        self.pen = Products.objects.create(name="pen", price=10)
+        self.pen.tags.add(self.pens)
+
+    def read(self, name: str) -> dict:
+        with default_storage.open(name) as file:
+            return json.loads(gzip.decompress(file.read()))
+
+    def test_only_affected_shards_are_rebuilt(self):
+        builder = CatalogSnapshotBuilder()
+        first = builder.build()
+        self.assertEqual(builder.rebuilt_shards, 2)
+        self.assertIsNone(builder.build())
+
+        self.book.price = 200
+        self.book.save()
+        second = builder.build()
+        self.assertEqual(builder.rebuilt_shards, 1)
+
+        books, pens = str(self.books.uuid), str(self.pens.uuid)
+        self.assertEqual(second.shards[pens], first.shards[pens])
+        self.assertNotEqual(second.shards[books], first.shards[books])
+        products = self.read(second.shards[books]["file"])["products"]
+        self.assertEqual([p["price"] for p in products], ["200.00"])
+        self.assertEqual(len(self.read(second.catalog_file)["products"]), 2)
+
+    def test_snapshot_endpoint_redirects_to_current_files(self):
+        url = reverse("shop:products_snapshot")
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        snapshot = CatalogSnapshotBuilder().build()
+        response = self.client.get(url, {"tag": "pens"})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(
+            response["Location"].endswith(snapshot.shards[str(self.pens.uuid)]["file"])
+        )
+        self.assertEqual(response["X-Catalog-Snapshot-Version"], str(snapshot.version))
+
+
+class CatalogImportTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.uuids = ["9b2f6f8e-0000-4000-8000-00000000000%d" % i for i in range(1, 4)]
+
+    def write_csv(self, rows: list) -> str:
+        path = f"{self.directory}/feed.csv"
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(
+                file, fieldnames=["uuid", "name", "price", "sale", "tags", "images"]
+            )
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def test_csv_feed_with_cyrillic_tags(self):
+        path = self.write_csv(
+            [
+                {
+                    "uuid": self.uuids[0],
+                    "name": "Ручка",
+                    "price": "10",
+                    "tags": "Ручки|Тетради",
+                    "images": "product/images/1.jpg",
+                },
+                {"uuid": self.uuids[1], "name": "Блокнот", "price": "20", "sale": "10"},
+                {"uuid": "broken", "name": "x", "price": "1"},
+                {"uuid": self.uuids[2], "name": "Скрепки", "price": "5", "tags": "!!!"},
+            ]
+        )
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command(
+            "import_catalog", path, "--chunk-size", "2", stdout=stdout, stderr=stderr
+        )
+        self.assertIn("Imported: 3, invalid: 1", stdout.getvalue())
+        self.assertIn("broken", stderr.getvalue())
+
+        self.assertEqual(
+            set(Tags.objects.values_list("slag", flat=True)),
+            {"ручки", "тетради", tag_slug("!!!")},
+        )
+        self.assertEqual(tag_slug("!!!"), tag_slug("!!!"))
+        pen = Products.objects.get(uuid=self.uuids[0])
+        self.assertEqual(
+            set(pen.tags.values_list("name", flat=True)), {"Ручки", "Тетради"}
+        )
+        self.assertEqual(
+            list(pen.images.values_list("file", flat=True)), ["product/images/1.jpg"]
+        )
+        notebook = Products.objects.get(uuid=self.uuids[1])
+        self.assertEqual(notebook.effective_price, Decimal("18.00"))
+
+    def test_existing_slugs_are_kept_and_collisions_suffixed(self):
+        Tags.objects.create(name="Ручки", slag="pens")
+        Tags.objects.create(name="Офис (старый)", slag="офис")
+
+        count, errors = CatalogImporter().import_chunk(
+            [
+                {
+                    "uuid": self.uuids[0],
+                    "name": "Ручка",
+                    "price": 10,
+                    "tags": ["Ручки", "Офис", "Блокноты", "блокноты!"],
+                }
+            ]
+        )
+        self.assertEqual((count, errors), (1, []))
+        slugs = dict(Tags.objects.values_list("name", "slag"))
+        self.assertEqual(slugs["Ручки"], "pens")
+        self.assertEqual(slugs["Офис (старый)"], "офис")
+        self.assertRegex(slugs["Офис"], r"^офис-[0-9a-f]{8}$")
+        self.assertEqual(slugs["Блокноты"], "блокноты")
+        self.assertRegex(slugs["блокноты!"], r"^блокноты-[0-9a-f]{8}$")
+        self.assertEqual(Products.objects.get().tags.count(), 4)
+
+    def test_skip_resumes_after_committed_rows(self):
+        path = f"{self.directory}/feed.jsonl"
+        with open(path, "w", encoding="utf-8") as file:
+            for i, uuid in enumerate(self.uuids):
+                file.write(json.dumps({"uuid": uuid, "name": f"p{i}", "price": 1}))
+                file.write("\n")
+        stdout = io.StringIO()
+        call_command("import_catalog", path, "--skip", "2", stdout=stdout)
+        self.assertEqual(
+            [str(pk) for pk in Products.objects.values_list("uuid", flat=True)],
+            [self.uuids[2]],
+        )
+        self.assertIn("resume with --skip 3", stdout.getvalue())
+
+    def test_reimport_replaces_links_and_updates_open_orders(self):
+        importer = CatalogImporter()
+        importer.import_chunk(
+            [{"uuid": self.uuids[0], "name": "pen", "price": 10, "tags": ["a", "b"]}]
+        )
+        product = Products.objects.get()
+        orders = {}
+        for status in (OrderStatusChoices.CREATED, OrderStatusChoices.PAID):
+            order = Orders.objects.create(user=User.objects.create(username=status))
+            ProductToOrder.objects.create(order=order, product=product, count=2)
+            Orders.objects.filter(pk=order.pk).update(status=status)
+            orders[status] = order.uuid
+
+        count, errors = CatalogImporter().import_chunk(
+            [{"uuid": self.uuids[0], "name": "pen", "price": 15, "tags": ["b", "c"]}]
+        )
+        self.assertEqual((count, errors), (1, []))
+        self.assertEqual(
+            sorted(product.tags.values_list("name", flat=True)), ["b", "c"]
+        )
+        totals = dict(Orders.objects.values_list("uuid", "total"))
+        self.assertEqual(totals[orders[OrderStatusChoices.CREATED]], Decimal("30.00"))
+        self.assertEqual(totals[orders[OrderStatusChoices.PAID]], Decimal("20.00"))
+
+
+class ImageVariantsTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Фоновые задачи не запускаем, варианты генерирует тест
+        patcher = mock.patch("shop.signals.schedule_variants")
+        self.schedule_variants = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        self.product = Products.objects.create(name="pen", price=10)
+
+    def create_image(self, name: str = "pen.png") -> ProductImage:
+        buffer = io.BytesIO()
+        Image.new("RGBA", (2000, 1000), (255, 0, 0, 128)).save(buffer, "PNG")
+        return ProductImage.objects.create(
+            product=self.product, file=ContentFile(buffer.getvalue(), name=name)
+        )
+
+    def test_new_image_schedules_variants_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = self.create_image()
+        self.schedule_variants.assert_called_once_with(image)
+
+    def test_variants_are_resized_and_listed_in_catalog(self):
+        image = self.create_image()
+        variants = generate_variants(image)
+        image.refresh_from_db()
+        self.assertEqual(image.variants, variants)
+        self.assertEqual(variants["source"], image.file.name)
+        for size_name, max_side in IMAGE_VARIANT_SIZES.items():
+            with default_storage.open(variants["sizes"][size_name]["jpeg"]) as file:
+                jpeg = Image.open(file)
+                self.assertEqual(jpeg.size, (max_side, max_side // 2))
+                self.assertEqual(jpeg.mode, "RGB")
+            with default_storage.open(variants["sizes"][size_name]["webp"]) as file:
+                self.assertEqual(Image.open(file).format, "WEBP")
+
+        response = self.client.get(reverse("shop:products_list"))
+        urls = response.json()[0]["images"][0]["variants"]
+        self.assertEqual(set(urls), set(IMAGE_VARIANT_SIZES))
+        self.assertEqual(
+            urls["card"]["webp"],
+            "http://testserver"
+            + default_storage.url(variants["sizes"]["card"]["webp"]),
+        )
+
+    def test_backfill_command_skips_actual_variants(self):
+        generate_variants(self.create_image("first.png"))
+        self.create_image("second.png")
+        ProductImage.objects.create(
+            product=self.product, file=ContentFile(b"not an image", name="broken.png")
+        )
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command("generate_image_variants", stdout=stdout, stderr=stderr)
+        self.assertIn("Generated: 1, up to date: 1, failed: 1", stdout.getvalue())
+        self.assertEqual(len(stderr.getvalue().splitlines()), 1)
+
+        stdout = io.StringIO()
+        call_command(
+            "generate_image_variants", "--force", stdout=stdout, stderr=io.StringIO()
+        )
+        self.assertIn("Generated: 2, up to date: 0, failed: 1", stdout.getvalue())
@@ -1,19 +1,38 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = "shop"
 
+# Под ASGI (ASGI_MODE=True) корзина обслуживается async view
+orders_viewset = views.AsyncOrdersViewSet if settings.ASGI_MODE else views.OrdersViewSet
+
 urlpatterns = [
     path(
         "products/",
         views.ProductsReadOnlyViewSet.as_view({"get": "list"}),
         name="products_list",
     ),
+    path(
+        "products/snapshot/",
+        views.CatalogSnapshotView.as_view(),
+        name="products_snapshot",
+    ),
     path(
         "orders/",
-        views.OrdersViewSet.as_view(
+        orders_viewset.as_view(
             {"get": "retrieve", "post": "create", "patch": "update", "delete": "destroy"}
         ),
         name="orders_list",
     ),
+    path(
+        "orders/history/",
+        views.OrderHistoryViewSet.as_view({"get": "list"}),
+        name="orders_history",
+    ),
+    path(
+        "orders/products/",
+        views.OrdersViewSet.as_view({"patch": "update_products"}),
+        name="orders_products",
+    ),
 ]
@@ -1,24 +1,72 @@
+from uuid import UUID
+
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
 from rest_framework.request import Request
-from rest_framework.exceptions import ValidationError
-from .models import Products, Orders, OrderStatusChoices
-from paper4auth.models import Profile
+from rest_framework.exceptions import ValidationError, NotFound
+from .models import Products, Orders, OrderStatusChoices, ORDERS_ONE_CREATED_PER_USER
+from .resolvers import chat_resolver
 
 
 def get_order_by_chat_id(chat_id: str) -> Orders:
     return get_object_or_404(Orders, user__profiling__chat_id=chat_id, status=OrderStatusChoices.CREATED)
 
+def create_open_order(user_id: int) -> Orders:
+    """
+    Один INSERT без предварительной проверки: второй CREATED заказ
+    отсекает частичный уникальный индекс, даже при параллельных запросах
+    """
+    try:
+        with transaction.atomic():
+            return Orders.objects.create(
+                user_id=user_id, status=OrderStatusChoices.CREATED
+            )
+    except IntegrityError as error:
+        constraint = getattr(
+            getattr(error.__cause__, "diag", None), "constraint_name", None
+        )
+        if constraint != ORDERS_ONE_CREATED_PER_USER:
+            raise
+        raise ValidationError(detail="Please pay for the last order.")
+
+
+def lock_open_order(chat_id: str, order_id) -> UUID:
+    """
+    order_id из кеша chat_resolver может устареть (заказ оплачен или создан в
+    другом процессе): внутри transaction.atomic блокирует заказ и проверяет,
+    что он ещё CREATED. Иначе один раз перечитывает открытый заказ из БД мимо
+    кеша и блокирует его; если и его нет — 404. Возвращает uuid
+    заблокированного заказа
+    """
+
+    def lock(pk) -> bool:
+        return (
+            Orders.objects.select_for_update()
+            .filter(uuid=pk, status=OrderStatusChoices.CREATED)
+            .exists()
+        )
+
+    if lock(order_id):
+        return order_id
+    chat = chat_resolver.refresh(chat_id)
+    if chat is not None and chat.order_id not in (None, order_id) and lock(chat.order_id):
+        return chat.order_id
+    raise NotFound("No CREATED order for this chat_id.")
+
+
 def modify_data_for_product_to_order_serializer(request: Request) -> dict:
     chat_id: str = request.data.get("chat_id")
     product_id: str = request.data.get("product_id")
     count: int = request.data.get("count")
     if not chat_id or not product_id or not count:
      raise ValidationError("fields: chat_id, product_id, count is valid")
-    order = get_order_by_chat_id(chat_id=chat_id)
+    chat = chat_resolver.resolve_order(chat_id)
+    if chat is None or chat.order_id is None:
+        raise NotFound("No CREATED order for this chat_id.")
     product = get_object_or_404(Products, uuid=product_id)
 
     return {
-        "order": order.uuid,
+        "order": chat.order_id,
         "product": product.uuid,
         "count": count
     }
@@ -1,34 +1,290 @@
-from rest_framework.viewsets import ReadOnlyModelViewSet, ViewSet
+from rest_framework.viewsets import GenericViewSet, ReadOnlyModelViewSet, ViewSet
+from rest_framework.mixins import ListModelMixin
+from adrf.shortcuts import aget_object_or_404
+from adrf.viewsets import ViewSet as AsyncViewSet
+from asgiref.sync import sync_to_async
+from rest_framework.views import APIView
 from rest_framework.filters import OrderingFilter
 from rest_framework.request import Request
 from rest_framework.response import Response
-from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.exceptions import NotFound, ValidationError
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch, QuerySet
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample
 
 from typing import Dict, List
 
-from .filters import ProductTagsFilter
+from paper4backend.query_budget import query_budget
+from .idempotency import IDEMPOTENCY_KEY_PARAMETER, idempotent
+from .filters import OrderHistoryFilter, ProductTagsFilter, ProductSearchFilter
+from .pagination import OrderHistoryPagination, ProductKeysetPagination
+from .resolvers import chat_resolver
+from .cache import CatalogResponseCache
+from .fast_serializers import ORJSONRenderer, ProductFastSerializer
+from .snapshots import get_current_snapshot
 from .serializers import (
     ProductSerializer,
+    ProductCardSerializer,
     OrderSerializer,
     ProductToOrderSerializer,
     CreateOrderRequestSerializer,
     AddProductInOrderRequestSerializer,
+    CartLineSerializer,
+    CartUpdateSerializer,
+    OrderHistorySerializer,
 )
-from .models import Products, Orders, OrderStatusChoices, ProductToOrder
-from .utils import modify_data_for_product_to_order_serializer, get_order_by_chat_id
+from .models import (
+    Products,
+    ProductImage,
+    Tags,
+    Orders,
+    OrderStatusChoices,
+    ProductToOrder,
+)
+from .utils import (
+    create_open_order,
+    lock_open_order,
+    modify_data_for_product_to_order_serializer,
+    get_order_by_chat_id,
+)
+
+PRODUCT_CARD_VIEW = "card"
 
 
-@extend_schema(summary="Get products")
+@extend_schema(
+    summary="Get products",
+    parameters=[
+        OpenApiParameter(
+            type=str,
+            name="fields",
+            location=OpenApiParameter.QUERY,
+            description="Comma-separated product fields to return",
+        ),
+        OpenApiParameter(
+            type=str,
+            name="omit",
+            location=OpenApiParameter.QUERY,
+            description="Comma-separated product fields to leave out",
+        ),
+        OpenApiParameter(
+            type=str,
+            name="view",
+            location=OpenApiParameter.QUERY,
+            enum=[PRODUCT_CARD_VIEW],
+            description="card: name, price and the first image only",
+        ),
+    ],
+)
 class ProductsReadOnlyViewSet(ReadOnlyModelViewSet):
-    queryset = Products.objects.prefetch_related("images").all()
+    queryset = Products.objects.all()
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, OrderingFilter]
-    ordering_fields = ["name", "price", "sale", "created_at", "updated_at", "tags"]
+    filter_backends = [DjangoFilterBackend, OrderingFilter, ProductSearchFilter]
+    ordering_fields = [
+        "name",
+        "price",
+        "sale",
+        "effective_price",
+        "created_at",
+        "updated_at",
+    ]
     ordering = ["name"]
     filterset_class = ProductTagsFilter
+    pagination_class = ProductKeysetPagination
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+    # list через ProductFastSerializer (values() вместо ModelSerializer)
+    use_fast_serializer = True
+    # Поля сериализатора, которые читаются не из колонок, а через prefetch.
+    # Сортировка связей должна совпадать с ProductFastSerializer
+    relation_prefetches = {
+        "images": Prefetch("images", queryset=ProductImage.objects.order_by("pk")),
+        "tags": Prefetch("tags", queryset=Tags.objects.order_by("name")),
+        "image": Prefetch(
+            "images",
+            queryset=ProductImage.objects.order_by("pk")[:1],
+            to_attr="first_images",
+        ),
+    }
+
+    def is_card_view(self) -> bool:
+        return self.request.query_params.get("view") == PRODUCT_CARD_VIEW
+
+    def get_serializer_class(self):
+        if self.is_card_view():
+            return ProductCardSerializer
+        return ProductSerializer
+
+    def get_serializer(self, *args, **kwargs):
+        if not self.is_card_view():
+            kwargs["fields"] = self.get_fields()
+        return super().get_serializer(*args, **kwargs)
+
+    def parse_fields_param(self, name: str) -> List[str]:
+        value = self.request.query_params.get(name, "")
+        return [field.strip() for field in value.split(",") if field.strip()]
+
+    def get_fields(self) -> List[str]:
+        """
+        Поля ответа с учётом ?fields= / ?omit= (или поля карточки)
+        """
+        if self.is_card_view():
+            return ProductCardSerializer.Meta.fields
+        available = ProductSerializer.Meta.fields
+        fields = self.parse_fields_param("fields") or available
+        omit = self.parse_fields_param("omit")
+        unknown = sorted((set(fields) | set(omit)) - set(available))
+        if unknown:
+            raise ValidationError({"fields": f"Unknown fields: {', '.join(unknown)}"})
+        return [field for field in available if field in fields and field not in omit]
+
+    def get_queryset(self) -> QuerySet:
+        prefetches = [
+            self.relation_prefetches[field]
+            for field in self.get_fields()
+            if field in self.relation_prefetches
+        ]
+        return super().get_queryset().prefetch_related(*prefetches)
+
+    def filter_queryset(self, queryset: QuerySet) -> QuerySet:
+        """
+        Из БД читаются только нужные колонки + колонки сортировки (по ним
+        строится курсор keyset-пагинации).
+        """
+        queryset = super().filter_queryset(queryset)
+        columns = [
+            field
+            for field in self.get_fields()
+            if field not in self.relation_prefetches
+        ]
+        ordering = [
+            name.lstrip("-")
+            for name in queryset.query.order_by
+            if isinstance(name, str)
+            and name.lstrip("-") not in queryset.query.annotations
+        ]
+        return queryset.only("uuid", *columns, *ordering)
+
+    @query_budget(4)
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        response_cache = CatalogResponseCache(request=request)
+        headers = {"ETag": response_cache.etag}
+        if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+        if response_cache.etag in if_none_match or "*" in if_none_match:
+            return Response(status=304, headers=headers)
+
+        data = response_cache.get()
+        if data is None:
+            data = self.get_list_data(request, *args, **kwargs)
+            response_cache.set(data=data)
+        return Response(data, headers=headers)
+
+    def get_list_data(self, request: Request, *args, **kwargs):
+        if not self.use_fast_serializer or self.is_card_view():
+            return super().list(request, *args, **kwargs).data
+
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = ProductFastSerializer(fields=self.get_fields(), request=request)
+        ordering = [
+            name.lstrip("-")
+            for name in queryset.query.order_by
+            if isinstance(name, str)
+        ]
+        rows = serializer.values(queryset, extra=ordering)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page)).data
+        return serializer.serialize(list(rows))
+
+
+class CatalogSnapshotView(APIView):
+    @extend_schema(
+        summary="Redirect to the current catalog snapshot (gzip JSON)",
+        parameters=[
+            OpenApiParameter(
+                type=str,
+                name="tag",
+                location=OpenApiParameter.QUERY,
+                description="Tag slug, redirects to this tag's shard",
+            )
+        ],
+        responses={302: None, 404: Dict[str, str]},
+    )
+    @query_budget(1)
+    def get(self, request: Request) -> Response:
+        snapshot = get_current_snapshot()
+        if snapshot is None:
+            raise NotFound("Catalog snapshot is not built yet.")
+
+        file = snapshot.catalog_file
+        slag = request.query_params.get("tag")
+        if slag:
+            file = next(
+                (
+                    shard["file"]
+                    for shard in snapshot.shards.values()
+                    if shard["slag"] == slag
+                ),
+                None,
+            )
+            if file is None:
+                raise NotFound("Tag not found in catalog snapshot.")
+
+        return Response(
+            status=302,
+            headers={
+                "Location": request.build_absolute_uri(default_storage.url(file)),
+                "X-Catalog-Snapshot-Version": str(snapshot.version),
+            },
+        )
+
+
+@extend_schema(
+    summary="Orders history by chat_id, newest first",
+    description=(
+        "Only orders still in the working tables. Finished orders moved to the "
+        "archive by archive_orders (older than --older-than months) are not "
+        "listed."
+    ),
+    parameters=[
+        OpenApiParameter(
+            type=str, name="chat_id", location=OpenApiParameter.QUERY, required=True
+        )
+    ],
+)
+class OrderHistoryViewSet(ListModelMixin, GenericViewSet):
+    serializer_class = OrderHistorySerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = OrderHistoryFilter
+    pagination_class = OrderHistoryPagination
+
+    def get_queryset(self) -> QuerySet:
+        chat_id: str = self.request.query_params.get("chat_id")
+        if not chat_id:
+            raise ValidationError("Please add query params chat_id.")
+        chat = chat_resolver.resolve(chat_id)
+        if chat is None:
+            raise ValidationError("Invalid chat_id.")
+        return (
+            Orders.objects.filter(user_id=chat.user_id)
+            .select_related("payment")
+            .prefetch_related(
+                Prefetch(
+                    "products",
+                    queryset=ProductToOrder.objects.select_related("product").order_by(
+                        "pk"
+                    ),
+                )
+            )
+            .order_by("-created_timestamp")
+        )
+
+    @query_budget(3)
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        return super().list(request, *args, **kwargs)
 
 
 extend_schema(summary="Orders CRUD")
@@ -42,13 +298,16 @@ class OrdersViewSet(ViewSet):
             OpenApiParameter(type=str, name="chat_id", location=OpenApiParameter.QUERY)
         ],
     )
+    @query_budget(2)
     def retrieve(self, request: Request) -> Response:
         chat_id: str = request.GET.get("chat_id")
         if not chat_id:
             raise ValidationError("Please add query params chat_id.")
 
         order = get_object_or_404(
-            Orders, user__profiling__chat_id=chat_id, status=OrderStatusChoices.CREATED
+            Orders.objects.select_related("payment").prefetch_related("products"),
+            user__profiling__chat_id=chat_id,
+            status=OrderStatusChoices.CREATED,
         )
 
         serializer = OrderSerializer(order)
@@ -58,7 +317,10 @@ class OrdersViewSet(ViewSet):
         summary="Create new Order if not CREATED Order",
         request=CreateOrderRequestSerializer,
         responses={200: OrderSerializer, 400: Dict[str, list] | List[str]},
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
     )
+    @idempotent
+    @query_budget(8)
     def create(self, request: Request) -> Response:
         serializer = OrderSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -69,15 +331,38 @@ class OrdersViewSet(ViewSet):
         summary="Add or update Product in current CREATED Order by chat_id",
         request=AddProductInOrderRequestSerializer,
         responses={200: ProductToOrderSerializer, 400: Dict[str, list] | List[str]},
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
     )
+    @idempotent
+    @query_budget(11)
     def update(self, request: Request) -> Response:
-        serializer = ProductToOrderSerializer(
-            data=modify_data_for_product_to_order_serializer(request=request)
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        data = modify_data_for_product_to_order_serializer(request=request)
+        with transaction.atomic():
+            data["order"] = lock_open_order(request.data["chat_id"], data["order"])
+            serializer = ProductToOrderSerializer(data=data)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
         return Response(serializer.data)
 
+    @extend_schema(
+        summary="Set counts of several Products in current CREATED Order by chat_id",
+        description="count 0 removes the Product from the Order",
+        request=CartUpdateSerializer,
+        responses={
+            200: ProductToOrderSerializer(many=True),
+            400: Dict[str, list] | List[str],
+            404: Dict[str, str],
+        },
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
+    )
+    @idempotent
+    @query_budget(9)
+    def update_products(self, request: Request) -> Response:
+        serializer = CartUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = serializer.save()
+        return Response(ProductToOrderSerializer(lines, many=True).data)
+
     @extend_schema(
         summary="Remove product from order",
         parameters=[
@@ -85,9 +370,12 @@ class OrdersViewSet(ViewSet):
             OpenApiParameter(
                 type=str, name="product_id", location=OpenApiParameter.QUERY
             ),
+            IDEMPOTENCY_KEY_PARAMETER,
         ],
         responses={204: None, 404: Dict[str, str], 400: Dict[str, str]},
     )
+    @idempotent
+    @query_budget(6)
     def destroy(self, request: Request) -> Response:
         chat_id: str = request.query_params.get("chat_id")
         product_id: str = request.query_params.get("product_id")
@@ -97,5 +385,121 @@ class OrdersViewSet(ViewSet):
             ProductToOrder, order=order, product=product
         )
         product_to_order.delete()
-        product_to_order.save()
+        return Response(status=204)
+
+
+class AsyncOrdersViewSet(AsyncViewSet):
+    """
+    Те же действия, что у OrdersViewSet, для ASGI (ASGI_MODE): запросы к БД
+    через aget/acreate/aupdate_or_create, поток не держится на время ожидания.
+    Транзакционные части (создание заказа с Payment, сериализация связей)
+    выполняются в sync_to_async.
+    """
+
+    @extend_schema(
+        summary="Get last created Order or return 404",
+        responses={200: OrderSerializer, 404: Dict[str, str]},
+        parameters=[
+            OpenApiParameter(type=str, name="chat_id", location=OpenApiParameter.QUERY)
+        ],
+    )
+    async def retrieve(self, request: Request) -> Response:
+        chat_id: str = request.query_params.get("chat_id")
+        if not chat_id:
+            raise ValidationError("Please add query params chat_id.")
+
+        order = await aget_object_or_404(
+            Orders.objects.select_related("payment").prefetch_related("products"),
+            user__profiling__chat_id=chat_id,
+            status=OrderStatusChoices.CREATED,
+        )
+        return Response(OrderSerializer(order).data)
+
+    @extend_schema(
+        summary="Create new Order if not CREATED Order",
+        request=CreateOrderRequestSerializer,
+        responses={200: OrderSerializer, 400: Dict[str, list] | List[str]},
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
+    )
+    @idempotent
+    async def create(self, request: Request) -> Response:
+        chat_id: str = request.data.get("chat_id")
+        if not chat_id:
+            raise ValidationError({"chat_id": ["This field is required."]})
+        chat = await chat_resolver.aresolve(chat_id)
+        if chat is None:
+            raise ValidationError({"chat_id": ["Invalid chat_id."]})
+
+        order = await sync_to_async(create_open_order)(user_id=chat.user_id)
+        data = await sync_to_async(lambda: OrderSerializer(order).data)()
+        return Response(data)
+
+    @extend_schema(
+        summary="Add or update Product in current CREATED Order by chat_id",
+        request=AddProductInOrderRequestSerializer,
+        responses={200: ProductToOrderSerializer, 400: Dict[str, list] | List[str]},
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
+    )
+    @idempotent
+    async def update(self, request: Request) -> Response:
+        chat_id: str = request.data.get("chat_id")
+        if (
+            not chat_id
+            or not request.data.get("product_id")
+            or not request.data.get("count")
+        ):
+            raise ValidationError("fields: chat_id, product_id, count is valid")
+        line = CartLineSerializer(data=request.data)
+        line.is_valid(raise_exception=True)
+        if line.validated_data["count"] < 1:
+            raise ValidationError({"count": ["Ensure this value is greater than 0."]})
+
+        chat = await chat_resolver.aresolve_order(chat_id)
+        if chat is None or chat.order_id is None:
+            raise NotFound("No CREATED order for this chat_id.")
+        product = await aget_object_or_404(
+            Products.objects.only("uuid"), uuid=line.validated_data["product_id"]
+        )
+
+        @sync_to_async
+        def set_line() -> ProductToOrder:
+            with transaction.atomic():
+                order_id = lock_open_order(chat_id, chat.order_id)
+                product_to_order, _ = ProductToOrder.objects.update_or_create(
+                    order_id=order_id,
+                    product_id=product.uuid,
+                    defaults={"count": line.validated_data["count"]},
+                )
+            return product_to_order
+
+        return Response(ProductToOrderSerializer(await set_line()).data)
+
+    @extend_schema(
+        summary="Remove product from order",
+        parameters=[
+            OpenApiParameter(type=str, name="chat_id", location=OpenApiParameter.QUERY),
+            OpenApiParameter(
+                type=str, name="product_id", location=OpenApiParameter.QUERY
+            ),
+            IDEMPOTENCY_KEY_PARAMETER,
+        ],
+        responses={204: None, 404: Dict[str, str], 400: Dict[str, str]},
+    )
+    @idempotent
+    async def destroy(self, request: Request) -> Response:
+        chat_id: str = request.query_params.get("chat_id")
+        product_id: str = request.query_params.get("product_id")
+        chat = await chat_resolver.aresolve_order(chat_id) if chat_id else None
+        if chat is None or chat.order_id is None:
+            raise NotFound("No CREATED order for this chat_id.")
+
+        @sync_to_async
+        def delete_line() -> None:
+            with transaction.atomic():
+                order_id = lock_open_order(chat_id, chat.order_id)
+                get_object_or_404(
+                    ProductToOrder, order_id=order_id, product_id=product_id
+                ).delete()
+
+        await delete_line()
         return Response(status=204)